@@ -18,11 +18,22 @@ TWITTER_API = {
 TWITTER_TRACKING = ["@scorebot1", "#pvjctf", "@pvjredcell"]
 APPEND_SLASH = False
 SBE_VERSION = "v3.3.4"
+# Addresses of the reverse proxies in front of Scorebot.  The client address of a request is only taken from the
+# "X-Forwarded-For" header when the connection comes from one of these, otherwise the connection address is used.
+SBE_PROXIES = []
+# Per client address limit (per minute) and burst for the flag and beacon API, checked before the Team token.
+SBE_LIMIT_CLIENT_RATE = 600
+SBE_LIMIT_CLIENT_BURST = 60
+# Number of scoreboard long-polls and event streams per process that may wait for new data.  Each one holds a worker
+# thread while waiting, only raise this above 0 on a threaded server with more threads than this.  With 0, polls
+# answer right away with the time to wait and streams are refused, so clients fall back to polling.
+SBE_DELTA_WAIT_MAX = 0
 MEDIA_URL = "/upload/"
 ALLOWED_HOSTS = ["*"]
 LANGUAGE_CODE = "en-us"
 STATIC_URL = "/static/"
 LOG_DIR = "/tmp/scorebot3"
+LOG_LEVEL = "DEBUG"
 ROOT_URLCONF = "scorebot.urls"
 DUMP_DIR = "/tmp/scorebot3_dumps"
 MEDIA_ROOT = "/home/scorebot3/logos"
@@ -31,7 +42,7 @@ SECRET_KEY = "mvn+$y(2lz%!nga3h@p7jf*zsrop^(ojp1)=mdn1gz+im-c%re"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PLUGIN_DIR = os.path.join(BASE_DIR, "scorebot_assets", "plugins")
 DAEMON_DIR = os.path.join(BASE_DIR, "scorebot_assets", "daemons")
-log_init(LOG_DIR, "DEBUG")
+log_init(LOG_DIR, LOG_LEVEL)
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -1,6 +1,8 @@
-from scorebot.utils.logger import log_debug, log_error, log_info, log_warning
+import time
+import logging
 
-SCORE_EVENTS = []
+from scorebot.utils.scorelog import SCORE_QUEUE, ScoreEvent
+from scorebot.utils.logger import log_error, log_enabled, log_message
 
 
 def api_event(game_id, event_message):
@@ -11,41 +13,30 @@ def api_event(game_id, event_message):
         log_error('EVENT', str(eventError))
 
 
-def api_info(api_name, message, request=None):
-    if request is not None:
-        client = get_ip(request)
-        log_info('API', '%s (%s): %s' % (api_name.upper(), client, message))
-        del client
-    else:
-        log_info('API', '%s (NO-IP): %s' % (api_name.upper(), message))
+def api_log(log_level, api_name, message, request=None, message_args=None):
+    if not log_enabled('API', log_level):
+        return
+    if message_args:
+        message = message % tuple((a() if callable(a) else a) for a in message_args)
+    log_message('API', log_level, '%s (%s): %s' % (api_name.upper(), (get_ip(request) if request is not None
+                                                                      else 'NO-IP'), message))
 
 
-def api_error(api_name, message, request=None):
-    if request is not None:
-        client = get_ip(request)
-        log_error('API', '%s (%s): %s' % (api_name.upper(), client, message))
-        del client
-    else:
-        log_error('API', '%s (NO-IP): %s' % (api_name.upper(), message))
+def api_info(api_name, message, request=None, *message_args):
+    api_log(logging.INFO, api_name, message, request, message_args)
 
 
-def api_debug(api_name, message, request=None):
-    if request is not None:
-        client = get_ip(request)
-        log_debug('API', '%s (%s): %s' % (api_name.upper(), client, message))
-        del client
-    else:
-        log_debug('API', '%s (NO-IP): %s' % (api_name.upper(), message))
+def api_error(api_name, message, request=None, *message_args):
+    api_log(logging.ERROR, api_name, message, request, message_args)
 
 
-def api_warning(api_name, message, request=None):
-    if request is not None:
-        client = get_ip(request)
-        log_warning('API', '%s (%s): %s' % (api_name.upper(), client, message))
-        del client
-    else:
-        log_warning('API', '%s (NO-IP): %s' % (api_name.upper(), message))
+def api_debug(api_name, message, request=None, *message_args):
+    api_log(logging.DEBUG, api_name, message, request, message_args)
+
+
+def api_warning(api_name, message, request=None, *message_args):
+    api_log(logging.WARNING, api_name, message, request, message_args)
 
 
 def api_score(score_id, score_type, score_name, score_value, score_data=None):
-    SCORE_EVENTS.append('%s,%s,%s,%s,%s' % (score_id, score_type, score_name, score_value, score_data))
+    SCORE_QUEUE.put(ScoreEvent(time.time(), score_id, score_type, score_name, score_value, score_data))
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+
+
+class BulkUpdate(object):
+    """
+    Scorebot v3: BulkUpdate
+
+    Collects changed fields on model instances and writes them as grouped UPDATE statements instead of one "save"
+    call per instance.  Instances that share the same new values are updated with a single statement.  If an instance
+    is added more than once, the last values added are the ones that are written.
+    """
+
+    def __init__(self):
+        self.updates = OrderedDict()
+
+    def __len__(self):
+        return len(self.updates)
+
+    def add(self, instance, fields):
+        if instance is None or instance.pk is None:
+            raise ValueError('Parameter "instance" must be a saved "Model" object type!')
+        fields = tuple(fields)
+        self.updates[(instance.__class__, instance.pk, fields)] = tuple(getattr(instance, f) for f in fields)
+
+    def extend(self, bulk):
+        if bulk is None:
+            raise ValueError('Parameter "bulk" cannot be None!')
+        self.updates.update(bulk.updates)
+
+    def save(self):
+        update_groups = OrderedDict()
+        for (update_model, update_pk, update_fields), update_values in self.updates.items():
+            update_key = (update_model, update_fields, update_values)
+            if update_key not in update_groups:
+                update_groups[update_key] = list()
+            update_groups[update_key].append(update_pk)
+        for (update_model, update_fields, update_values), update_pks in update_groups.items():
+            update_model.objects.filter(pk__in=update_pks).update(**dict(zip(update_fields, update_values)))
+        self.updates.clear()
+        return len(update_groups)
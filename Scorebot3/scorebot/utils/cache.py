@@ -0,0 +1,66 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+
+class CacheTable(object):
+    """
+    Scorebot v3: CacheTable
+
+    Bounded, thread safe LRU cache.  Entries older than "timeout" seconds are dropped when read (a timeout of zero
+    keeps entries until they are pushed out or removed).  The cache is local to the process, so any data that can be
+    changed by another process should be given a timeout.
+    """
+
+    def __init__(self, name, size=256, timeout=0):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        if not isinstance(size, int) or size <= 0:
+            raise ValueError('Parameter "size" must be a positive "integer" object type!')
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                entry_time, entry_value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.timeout > 0 and (time.monotonic() - entry_time) > self.timeout:
+                del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry_value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'size': len(self.entries), 'max': self.size, 'hits': self.hits,
+                    'misses': self.misses}
@@ -0,0 +1,145 @@
+import time
+import atexit
+import threading
+
+from scorebot.utils.cache import CacheTable
+from scorebot.utils.logger import log_debug, log_error
+from scorebot.utils.constants import CONST_GAME_CHECKIN_SIZE, CONST_GAME_CHECKIN_TIMEOUT, \
+    CONST_GAME_CHECKIN_FLUSH_TIME
+
+
+class CheckinTable(object):
+    """
+    Scorebot v3: CheckinTable
+
+    Write-behind table of Beacon check-ins.  A check-in only records the time against the Beacon in memory, the
+    pending times are written to "GameCompromise.checkin" with a single UPDATE every "flush_time" seconds by a
+    background thread, and once more when the process exits.  The table also maps (Host, attacker, Token) to the
+    open Beacon so a repeated check-in does not need a query.  As Beacons are closed by the cleanup daemon in another
+    process, the first check-in of a Beacon after each flush is written straight away with an UPDATE that only
+    matches an open Beacon.  If the Beacon was closed the mapping is dropped and the caller has to look the Beacon up
+    again.  Mappings also expire after "timeout" seconds and are dropped when a flush finds that the Beacon was closed.
+    """
+
+    def __init__(self, name, size=CONST_GAME_CHECKIN_SIZE, timeout=CONST_GAME_CHECKIN_TIMEOUT,
+                 flush_time=CONST_GAME_CHECKIN_FLUSH_TIME):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        self.name = name
+        self.flush_time = flush_time
+        self.added = 0
+        self.written = 0
+        self.flushes = 0
+        self.flush_last = 0.0
+        self.flush_max = 0.0
+        self.thread = None
+        self.pending = dict()
+        self.verified = set()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.beacons = CacheTable(name, size, timeout)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get_beacon(self, host_id, attacker_id, token_id):
+        return self.beacons.get((host_id, attacker_id, token_id), None)
+
+    def checkin(self, host_id, attacker_id, token_id, beacon_id, checkin_time):
+        if self.thread is None:
+            self.start()
+        self.beacons.set((host_id, attacker_id, token_id), beacon_id)
+        with self.lock:
+            self.pending[beacon_id] = checkin_time
+            self.verified.add(beacon_id)
+            self.added += 1
+
+    def checkin_cached(self, host_id, attacker_id, token_id, checkin_time):
+        from scorebot_game.models import GameCompromise
+        beacon_id = self.get_beacon(host_id, attacker_id, token_id)
+        if beacon_id is None:
+            return None
+        with self.lock:
+            beacon_verified = beacon_id in self.verified
+        if not beacon_verified:
+            if GameCompromise.objects.filter(id=beacon_id, finish__isnull=True).update(checkin=checkin_time) == 0:
+                self.remove(host_id, attacker_id, token_id, beacon_id)
+                return None
+            with self.lock:
+                self.verified.add(beacon_id)
+            return beacon_id
+        self.checkin(host_id, attacker_id, token_id, beacon_id, checkin_time)
+        return beacon_id
+
+    def remove(self, host_id, attacker_id, token_id, beacon_id):
+        self.beacons.pop((host_id, attacker_id, token_id))
+        with self.lock:
+            self.pending.pop(beacon_id, None)
+            self.verified.discard(beacon_id)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='%s-writer' % self.name.lower(), daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_time)
+            try:
+                self.flush()
+            except Exception as flushError:
+                log_error('CHECKIN', 'Writing Beacon check-ins failed! (%s)' % str(flushError))
+
+    def flush(self):
+        from django.db.models import Case, When, Value, DateTimeField
+        from scorebot_game.models import GameCompromise
+        with self.flush_lock:
+            with self.lock:
+                if len(self.pending) == 0:
+                    return 0
+                checkins = self.pending
+                self.pending = dict()
+                self.verified = set()
+            flush_start = time.monotonic()
+            try:
+                beacons_open = set(GameCompromise.objects.filter(id__in=checkins.keys(), finish__isnull=True)
+                                   .values_list('id', flat=True))
+                if len(beacons_open) > 0:
+                    GameCompromise.objects.filter(id__in=beacons_open, finish__isnull=True).update(checkin=Case(
+                        *[When(id=beacon_id, then=Value(checkins[beacon_id])) for beacon_id in beacons_open],
+                        output_field=DateTimeField()
+                    ))
+            except Exception:
+                with self.lock:
+                    for beacon_id, checkin in checkins.items():
+                        if beacon_id not in self.pending or self.pending[beacon_id] < checkin:
+                            self.pending[beacon_id] = checkin
+                raise
+            if len(beacons_open) < len(checkins):
+                beacons_closed = set(checkins.keys()) - beacons_open
+                with self.beacons.lock:
+                    for beacon_key in [k for k, v in self.beacons.entries.items() if v[1] in beacons_closed]:
+                        del self.beacons.entries[beacon_key]
+                log_debug('CHECKIN', 'Dropped "%d" closed Beacons from the check-in table.' % len(beacons_closed))
+                del beacons_closed
+            flush_time = time.monotonic() - flush_start
+            with self.lock:
+                self.flushes += 1
+                self.written += len(beacons_open)
+                self.flush_last = flush_time
+                self.flush_max = max(self.flush_max, flush_time)
+            del flush_time
+            del flush_start
+            return len(beacons_open)
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'pending': len(self.pending), 'beacons': len(self.beacons),
+                    'added': self.added, 'written': self.written, 'flushes': self.flushes,
+                    'flush_last': self.flush_last, 'flush_max': self.flush_max}
+
+
+CHECKIN_TABLE = CheckinTable('CHECKIN')
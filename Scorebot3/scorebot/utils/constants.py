@@ -1,4 +1,7 @@
 CONST_GRID_FLAG_VALUE = 100
+CONST_GRID_FLAG_INDEX_TIMEOUT = 30
+CONST_GRID_JOB_TEMPLATE_SIZE = 2048
+CONST_GRID_JOB_TEMPLATE_TIMEOUT = 60
 CONST_GAME_GAME_RUNNING = 1
 CONST_GAME_GAME_MODE_CHOICES = (
     (0, "Red-v-Blue"),
@@ -86,6 +89,100 @@ CONST_GAME_GAME_STATUS_CHOICES = (
 CONST_GAME_EVENT_TYPE_CHOICES = ((0, "Message"), (1, "Window"), (2, "Effect"))
 CONST_EVENT_DEFAULT_TIMEOUT = 10
 CONST_GAME_EVENT_TIMEOUT_DEFAULT = 5
+CONST_GAME_EVENT_MESSAGE = 0
+CONST_GAME_EVENT_WINDOW = 1
+CONST_GAME_EVENT_EFFECT = 2
+CONST_GAME_EVENT_TWEET_BATCH = 25
+CONST_GAME_JOB_COUNT_MAX = 250
+CONST_GAME_SUBNET_INDEX_TIMEOUT = 30
+CONST_GAME_CHECKIN_SIZE = 4096
+CONST_GAME_CHECKIN_TIMEOUT = 30
+CONST_GAME_CHECKIN_FLUSH_TIME = 5
+CONST_GAME_CLEANUP_BATCH = 500
+CONST_GAME_LEASE_SLOTS = 512
+CONST_GAME_LEASE_TICK = 1
+CONST_CORE_ACCESS_CACHE_SIZE = 512
+CONST_CORE_ACCESS_CACHE_TIMEOUT = 60
+CONST_CORE_OPTIONS_CACHE_SIZE = 64
+CONST_CORE_OPTIONS_CACHE_TIMEOUT = 30
+CONST_CORE_CREDIT_CACHE_TIMEOUT = 60
+CONST_GAME_SCOREBOARD_CACHE_SIZE = 32
+CONST_GAME_SCOREBOARD_CACHE_TIMEOUT = 15
+CONST_GAME_DELTA_SCORE = 0
+CONST_GAME_DELTA_HOST = 1
+CONST_GAME_DELTA_FLAGS = 2
+CONST_GAME_DELTA_TICKETS = 3
+CONST_GAME_DELTA_BEACONS = 4
+CONST_GAME_DELTA_EVENTS = 5
+CONST_GAME_DELTA_TYPE_CHOICES = (
+    (0, "score"),
+    (1, "host"),
+    (2, "flags"),
+    (3, "tickets"),
+    (4, "beacons"),
+    (5, "events"),
+)
+CONST_CORE_LIMIT_SIZE = 4096
+CONST_CORE_LIMIT_WINDOW = 300
+CONST_CORE_LIMIT_HISTORY = 256
+CONST_CORE_LIMIT_CLIENT_RATE = 600
+CONST_CORE_LIMIT_CLIENT_BURST = 60
+CONST_CORE_SCORE_QUEUE_SIZE = 10000
+CONST_CORE_SCORE_QUEUE_BATCH = 500
+CONST_CORE_SCORE_QUEUE_FLUSH_TIME = 5
+CONST_CORE_SCORE_QUEUE_POLICY = "drop-oldest"
+CONST_CORE_SCORE_QUEUE_POLICIES = ("drop-oldest", "drop-newest")
+CONST_CORE_DUMP_QUEUE_SIZE = 2000
+CONST_CORE_DUMP_FLUSH_TIME = 5
+CONST_CORE_DUMP_SEGMENT_SIZE = 16777216
+CONST_CORE_DUMP_SIZE_MAX = 536870912
+CONST_CORE_DAEMON_POLICY = "skip"
+CONST_CORE_DAEMON_POLICIES = ("skip", "queue")
+CONST_CORE_DAEMON_WAIT_MAX = 5
+CONST_CORE_DAEMON_LOCK = "daemon"
+CONST_CORE_DAEMON_LOCK_TIME = 30
+CONST_CORE_DAEMON_HISTOGRAM = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120)
+CONST_GAME_SCORE_HOST = 0
+CONST_GAME_SCORE_BEACON = 1
+CONST_GAME_SCORE_BEACON_ATTACKER = 2
+CONST_GAME_SCORE_TICKET = 3
+CONST_GAME_SCORE_TICKET_CLOSE = 4
+CONST_GAME_SCORE_TICKET_REOPEN = 5
+CONST_GAME_SCORE_FLAG_STOLEN = 6
+CONST_GAME_SCORE_FLAG_CAPTURED = 7
+CONST_GAME_SCORE_TRANSFER = 8
+CONST_GAME_SCORE_PURCHASE = 9
+CONST_GAME_SCORE_SOURCE_CHOICES = (
+    (0, "Host"),
+    (1, "Beacon"),
+    (2, "Beacon Attacker"),
+    (3, "Ticket"),
+    (4, "Ticket Close"),
+    (5, "Ticket Reopen"),
+    (6, "Flag Stolen"),
+    (7, "Flag Captured"),
+    (8, "Transfer"),
+    (9, "Purchase"),
+)
+CONST_GAME_SCORE_SOURCE_FIELDS = {
+    0: "uptime",
+    1: "beacons",
+    2: "beacons",
+    3: "tickets",
+    4: "tickets",
+    5: "tickets",
+    6: "flags",
+    7: "flags",
+    8: "uptime",
+    9: "uptime",
+}
+CONST_GAME_DELTA_KEEP_TIME = 900
+CONST_GAME_DELTA_POLL_TIME = 1
+CONST_GAME_DELTA_POLL_WAIT = 25
+CONST_GAME_DELTA_POLL_SIZE = 250
+CONST_GAME_DELTA_STREAM_TIME = 300
+CONST_GAME_DELTA_HEARTBEAT_TIME = 15
+CONST_GAME_DELTA_WAIT_MAX = 0
 CONST_GAME_GAME_OPTIONS_DEFAULTS = {
     "ticket_cost": 125,
     "round_time": 300,
@@ -101,6 +198,10 @@ CONST_GAME_GAME_OPTIONS_DEFAULTS = {
     "ticket_max_scoring": 14400,
     "ticket_reopen_multiplier": 10,
     "flag_captured_multiplier": 300,
+    "flag_rate": 60,
+    "flag_burst": 20,
+    "beacon_rate": 120,
+    "beacon_burst": 30,
 }
 CONST_GRID_SERVICE_STATUS_CHOICES = (
     (0, "pass"),
@@ -119,6 +220,8 @@ CONST_GRID_TICKET_CATEGORIES_CHOICES = (
     (5, "Deliverable"),
 )
 CONST_GRID_SERVICE_PROTOCOL_CHOICES = ((0, "tcp"), (1, "udp"), (2, "icmp"))
+CONST_GRID_SERVICE_PROTOCOL_NAMES = {k: v.lower() for k, v in CONST_GRID_SERVICE_PROTOCOL_CHOICES}
+CONST_GRID_SERVICE_STATUS_VALUES = {v.lower(): k for k, v in CONST_GRID_SERVICE_STATUS_CHOICES}
 CONST_GRID_CONTENT_TYPE_DEFAULT = "text"
 CONST_GRID_TICKET_EXPIRE_TIME_DEFAULT = 1800
 CONST_GAME_GAME_MESSAGE = "This is Scorebot v3"
@@ -1,125 +1,269 @@
 import os
 import time
+import heapq
+import uuid
+import queue
+import socket
 import importlib
 import threading
 import importlib.util
 
 from django.conf import settings
-from django.utils import timezone
+from django.db import DatabaseError, close_old_connections
 from scorebot.utils.logger import log_debug, log_error, log_info, log_warning, log_stdout
+from scorebot.utils.constants import CONST_CORE_DAEMON_POLICY, CONST_CORE_DAEMON_POLICIES, \
+    CONST_CORE_DAEMON_WAIT_MAX, CONST_CORE_DAEMON_HISTOGRAM, CONST_CORE_DAEMON_LOCK, CONST_CORE_DAEMON_LOCK_TIME
 
 
-def start_daemon():
+def start_daemon(lock_time=CONST_CORE_DAEMON_LOCK_TIME):
+    from scorebot_core.models import Lock
     log_stdout('DAEMON', 'DEBUG')
     log_info('DAEMON', 'Starting the Scorebot3 Daemon process..')
-    daemon_thread = Daemon()
-    daemon_thread.load_daemons(settings.DAEMON_DIR)
-    log_debug('DAEMON', 'Loaded "%d" daemons, [%s]..' % (len(daemon_thread.daemons),
-                                                         ', '.join([str(d.name) for d in daemon_thread.daemons])))
+    daemon_owner = '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+    daemon_thread = None
+    daemon_renewed = None
     try:
-        daemon_thread.start()
-        while daemon_thread.running:
-            pass
+        while daemon_thread is None or daemon_thread.is_alive():
+            try:
+                daemon_leader = Lock.acquire(CONST_CORE_DAEMON_LOCK, daemon_owner, lock_time)
+            except DatabaseError as lockError:
+                # The database may be busy (or locked by a long scoring transaction), keep the current state and try
+                # again next time.  A leader that could not renew the lock before it expired has to stop, as another
+                # process is now allowed to take over.
+                log_error('DAEMON', 'Daemon process "%s" could not reach the leader lock! (%s)'
+                          % (daemon_owner, str(lockError)))
+                close_old_connections()
+                if daemon_thread is not None and (time.monotonic() - daemon_renewed) >= lock_time:
+                    log_error('DAEMON', 'Daemon process "%s" could not renew the leader lock in time, stopping '
+                                        'daemons!' % daemon_owner)
+                    daemon_thread.stop()
+                    daemon_thread = None
+                time.sleep(lock_time / 3)
+                continue
+            if daemon_leader:
+                daemon_renewed = time.monotonic()
+            if daemon_thread is None and daemon_leader:
+                log_info('DAEMON', 'Daemon process "%s" is the leader, starting daemons..' % daemon_owner)
+                daemon_thread = Daemon()
+                daemon_thread.load_daemons(settings.DAEMON_DIR)
+                log_debug('DAEMON', 'Loaded "%d" daemons, [%s]..' % (
+                    len(daemon_thread.daemons), ', '.join([str(d.name) for d in daemon_thread.daemons])))
+                daemon_thread.start()
+            elif daemon_thread is not None and not daemon_leader:
+                log_error('DAEMON', 'Daemon process "%s" lost the leader lock, stopping daemons!' % daemon_owner)
+                daemon_thread.stop()
+                break
+            elif daemon_thread is None:
+                log_debug('DAEMON', 'Daemon process "%s" is waiting for the leader lock..' % daemon_owner)
+            time.sleep(lock_time / 3)
     except KeyboardInterrupt:
-        daemon_thread.stop()
         log_info('DAEMON', 'Stopping SBE Daemon process..')
+    finally:
+        if daemon_thread is not None:
+            daemon_thread.stop()
+            try:
+                Lock.release(CONST_CORE_DAEMON_LOCK, daemon_owner)
+            except DatabaseError as lockError:
+                log_error('DAEMON', 'Daemon process "%s" could not release the leader lock! (%s)'
+                          % (daemon_owner, str(lockError)))
+        del daemon_owner
+        del daemon_thread
+        del daemon_renewed
+
+
+class DaemonHistogram(object):
+    """
+    Scorebot v3: DaemonHistogram
+
+    Counts timings (in seconds) into fixed buckets.  Each bucket counts the values that are less than or equal to its
+    bound and larger than the previous bound, the last bucket counts everything larger than the largest bound.
+    """
+
+    def __init__(self, bounds=CONST_CORE_DAEMON_HISTOGRAM):
+        self.max = 0.0
+        self.count = 0
+        self.total = 0.0
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        for bucket, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[bucket] += 1
+                return
+        self.buckets[-1] += 1
+
+    def stats(self):
+        buckets = dict(zip(['<=%s' % b for b in self.bounds] + ['>%s' % self.bounds[-1]], self.buckets))
+        return {'count': self.count, 'max': self.max, 'average': (self.total / self.count if self.count > 0 else 0.0),
+                'buckets': buckets}
 
 
 class DaemonEntry(object):
     """
     Scorebot v3: DaemonEntry
 
-    Stores the state of the SBE Daemon threads.
+    Stores the schedule and state of a SBE Daemon.  The Daemon is run every "trigger" seconds.  A Daemon never runs
+    more than once at a time, if it is still running when it is next due the "policy" decides what happens, "skip"
+    drops that run and "queue" runs it again as soon as the current run finishes (at most one run is queued).
     """
 
-    def __init__(self, name, trigger, method, timeout=0):
+    def __init__(self, name, trigger, method, timeout=0, policy=CONST_CORE_DAEMON_POLICY):
         if name is None:
             raise ValueError('Parameter "name" cannot be None!')
         if not isinstance(trigger, int) or int(trigger) <= 0:
             raise ValueError('Parameter "trigger" must be a positive "integer" object type!')
         if not callable(method):
             raise ValueError('Parameter "method" must be a "callable" object type!')
-        self.next = None
+        if policy not in CONST_CORE_DAEMON_POLICIES:
+            raise ValueError('Parameter "policy" must be one of "%s"!' % ', '.join(CONST_CORE_DAEMON_POLICIES))
+        self.due = None
         self.name = name
-        self.thread = None
+        self.runs = 0
+        self.errors = 0
+        self.queued = 0
+        self.skipped = 0
+        self.timeouts = 0
+        self.worker = None
+        self.started = None
         self.method = method
+        self.policy = policy
+        self.pending = False
         self.running = False
         self.trigger = trigger
         self.timeout = timeout
-
-    def stop(self):
-        log_debug('DAEMON', 'Attempting to stop daemon "%s"..' % self.name)
-        self.running = False
-        self.thread.stop()
-        log_debug('DAEMON', 'Stopped daemon "%s"..' % self.name)
-        self.thread = None
-
-    def start(self):
-        log_debug('DAEMON', 'Attempting to start daemon "%s"..' % self.name)
-        if self.timeout > 0:
-            log_debug('DAEMON', 'Daemon "%s" has a set timeout of "%d" seconds..' % (self.name, self.timeout))
-        self.next = timezone.now()
-        self.running = True
-        self.thread = DaemonThread(self)
-        self.thread.start()
-        log_debug('DAEMON', 'Started Daemon "%s"!' % self.name)
-
-    def del_stop(self):
-        self.thread = None
-        self.running = False
+        self.duration = DaemonHistogram()
+        self.lateness = DaemonHistogram()
 
     def __bool__(self):
-        return self.running and self.thread is not None
-
-    def is_ready(self, now):
-        if self.running or self.thread is not None:
-            return False
-        if self.next is None:
-            return True
-        if (now - self.next).seconds >= self.trigger:
-            return True
-        return False
+        return self.running
 
     def is_timeout(self, now):
-        if self.timeout == 0:
+        if self.timeout == 0 or self.started is None or self.worker is None or self.worker.abandoned:
             return False
-        if (now - self.next).seconds > self.timeout:
-            return True
-        return False
+        return (now - self.started) > self.timeout
+
+    def stats(self):
+        return {'name': self.name, 'policy': self.policy, 'running': self.running, 'runs': self.runs,
+                'errors': self.errors, 'queued': self.queued, 'skipped': self.skipped, 'timeouts': self.timeouts,
+                'duration': self.duration.stats(), 'lateness': self.lateness.stats()}
 
 
 class Daemon(threading.Thread):
     """
     Scorebot v3: Daemon
 
-    The main thread that runs outside of the mod_wsgi and preforms time based events.  This thread calls other threads
-    to do work and is responsible for watching the other threads.
+    The main thread that runs outside of the mod_wsgi and preforms time based events.  Daemons are kept in a heap
+    ordered by the time they are next due and the thread sleeps until the first one is due.  Due Daemons are handed to
+    a fixed pool of DaemonWorker threads.  The pool has a worker for each Daemon by default, as a Daemon only uses one
+    worker at a time, a slow Daemon cannot hold up the others.  A worker running a Daemon past its timeout cannot be
+    stopped, it is abandoned and replaced so the pool keeps its size.
     """
 
-    def __init__(self):
+    def __init__(self, workers=0):
         threading.Thread.__init__(self, daemon=True)
+        self.heap = list()
         self.running = False
         self.daemons = list()
+        self.workers = list()
+        self.worker_size = workers
+        self.work = queue.Queue()
+        self.lock = threading.Condition()
 
     def run(self):
         self.running = True
-        while self.running:
-            now = timezone.now()
-            for daemon in self.daemons:
-                if daemon.__bool__():
+        for worker in range(self.worker_size if self.worker_size > 0 else max(1, len(self.daemons))):
+            self._add_worker()
+        now = time.monotonic()
+        with self.lock:
+            for daemon_index, daemon in enumerate(self.daemons):
+                heapq.heappush(self.heap, (now, daemon_index, daemon))
+            while self.running:
+                now = time.monotonic()
+                while len(self.heap) > 0 and self.heap[0][0] <= now:
+                    daemon_due, daemon_index, daemon = heapq.heappop(self.heap)
+                    self._dispatch(daemon, daemon_due)
+                    daemon_next = daemon_due + daemon.trigger
+                    heapq.heappush(self.heap, (daemon_next if daemon_next > now else now + daemon.trigger,
+                                               daemon_index, daemon))
+                    del daemon_due
+                    del daemon_next
+                for daemon in self.daemons:
                     if daemon.is_timeout(now):
-                        log_debug('DAEMON', 'killing Daemon "%s" due to timeout!' % self.name)
-                        daemon.stop()
-                else:
-                    if daemon.is_ready(now):
-                        daemon.start()
-            time.sleep(1)
+                        daemon.timeouts += 1
+                        daemon.worker.abandoned = True
+                        log_warning('DAEMON', 'Daemon "%s" passed its timeout of "%d" seconds, replacing its worker!'
+                                    % (daemon.name, daemon.timeout))
+                        self._add_worker()
+                daemon_wait = CONST_CORE_DAEMON_WAIT_MAX
+                if len(self.heap) > 0:
+                    daemon_wait = min(daemon_wait, self.heap[0][0] - now)
+                self.lock.wait(max(daemon_wait, 0))
+                del daemon_wait
 
     def stop(self):
-        for daemon in self.daemons:
-            if daemon.__bool__():
-                daemon.stop()
-        self.running = False
+        with self.lock:
+            self.running = False
+            for worker in self.workers:
+                worker.abandoned = True
+                self.work.put(None)
+            self.lock.notify_all()
+
+    def stats(self):
+        with self.lock:
+            return [d.stats() for d in self.daemons]
+
+    def _add_worker(self):
+        self.workers = [w for w in self.workers if w.is_alive() and not w.abandoned]
+        worker = DaemonWorker(self)
+        self.workers.append(worker)
+        worker.start()
+
+    def _dispatch(self, daemon, daemon_due):
+        if daemon.running:
+            if daemon.policy == 'queue' and not daemon.pending:
+                daemon.queued += 1
+                daemon.pending = True
+                log_debug('DAEMON', 'Daemon "%s" is still running, queued the next run.' % daemon.name)
+            else:
+                daemon.skipped += 1
+                log_debug('DAEMON', 'Daemon "%s" is still running, skipped this run.' % daemon.name)
+            return
+        daemon.due = daemon_due
+        daemon.running = True
+        self.work.put(daemon)
+
+    def run_daemon(self, worker, daemon):
+        with self.lock:
+            daemon.worker = worker
+            daemon.started = time.monotonic()
+            daemon.lateness.add(daemon.started - daemon.due)
+        log_info('DAEMON', 'Starting Daemon "%s"..' % daemon.name)
+        try:
+            daemon.method()
+        except Exception as threadError:
+            daemon.errors += 1
+            log_error('DAEMON', 'Daemon "%s" encountered an error when running! Exception: "%s"' %
+                      (daemon.name, str(threadError)))
+        with self.lock:
+            daemon_time = time.monotonic() - daemon.started
+            daemon.runs += 1
+            daemon.duration.add(daemon_time)
+            daemon.worker = None
+            daemon.started = None
+            if daemon.pending and self.running:
+                daemon.pending = False
+                daemon.due = time.monotonic()
+                self.work.put(daemon)
+            else:
+                daemon.pending = False
+                daemon.running = False
+            self.lock.notify()
+        log_info('DAEMON', 'Daemon "%s" finished running in "%.3f" seconds.' % (daemon.name, daemon_time))
+        del daemon_time
 
     def load_daemons(self, daemon_dir):
         if not os.path.isdir(daemon_dir):
@@ -156,31 +300,22 @@ class Daemon(threading.Thread):
         del daemon_list
 
 
-class DaemonThread(threading.Thread):
+class DaemonWorker(threading.Thread):
     """
-    Scorebot v3: DaemonThread
+    Scorebot v3: DaemonWorker
 
-    This is the worker thread for each triggered Daemon call.  This ensures that work is not done on the main thread.
+    A worker thread in the Daemon pool.  Workers take due Daemons from the work queue and run them, so that work is
+    not done on the main thread.  An abandoned worker exits once its current Daemon returns.
     """
 
-    def __init__(self, daemon_entry):
+    def __init__(self, daemon):
         threading.Thread.__init__(self, daemon=True)
-        self.running = False
-        self.entry = daemon_entry
+        self.daemon_pool = daemon
+        self.abandoned = False
 
     def run(self):
-        self.running = True
-        print('Starting Daemon "%s".' % self.entry.name)
-        log_info('DAEMON', 'Starting Daemon "%s"..' % self.entry.name)
-        try:
-            self.entry.method()
-        except Exception as threadError:
-            log_error('DAEMON', 'Daemon "%s" encountered an error when running! Exception: "%s"' %
-                      (self.entry.name, str(threadError)))
-        log_info('DAEMON', 'Daemon "%s" finished running.' % self.entry.name)
-        self.running = False
-        self.entry.del_stop()
-
-    def stop(self):
-        # TODO: Not much we can do here to stop a running process
-        self.running = False
+        while not self.abandoned:
+            daemon_entry = self.daemon_pool.work.get()
+            if daemon_entry is None:
+                break
+            self.daemon_pool.run_daemon(self, daemon_entry)
@@ -0,0 +1,84 @@
+import random
+import threading
+
+from collections import deque
+from django.utils import timezone
+from scorebot.utils.logger import log_debug
+
+CONST_DISPATCH_REBUILD_WAIT = 2
+
+
+class DispatchGame(object):
+    """
+    Scorebot v3: DispatchGame
+
+    The dispatch state of a single Game.  "ready" is the set of Host IDs that can currently be given out as Jobs,
+    shared by every Monitor in the Game.  Each GameMonitor has its own shuffled queue of Host IDs with the Monitor's
+    include/exclude rules already applied.  Queues are not cleaned when another Monitor takes a Host, instead entries
+    that are no longer in "ready" are skipped when popped.
+    """
+
+    def __init__(self):
+        self.ready = set()
+        self.queues = dict()
+        self.rebuilt = dict()
+
+
+class JobDispatch(object):
+    """
+    Scorebot v3: JobDispatch
+
+    Per-Game index of Hosts that are ready to be leased as Jobs.  Picking a Host is a pop from the GameMonitor's queue
+    and the queue is only rebuilt (with a single query set) from the database when it runs dry.  The database is still
+    the authority, the caller must claim the Host with a conditional update as other processes may have leased it.
+    """
+
+    def __init__(self):
+        self.games = dict()
+        self.lock = threading.Lock()
+
+    def _get_game(self, game_id):
+        try:
+            return self.games[game_id]
+        except KeyError:
+            dispatch_game = DispatchGame()
+            self.games[game_id] = dispatch_game
+            return dispatch_game
+
+    def _rebuild(self, dispatch_game, game_monitor):
+        now = timezone.now()
+        last = dispatch_game.rebuilt.get(game_monitor.id, None)
+        if last is not None and (now - last).total_seconds() < CONST_DISPATCH_REBUILD_WAIT:
+            return False
+        dispatch_game.rebuilt[game_monitor.id] = now
+        host_list = game_monitor.get_dispatch_hosts()
+        random.shuffle(host_list)
+        dispatch_game.ready.update(host_list)
+        dispatch_game.queues[game_monitor.id] = deque(host_list)
+        log_debug('JOB', 'Rebuilt the dispatch queue for Monitor "%s", "%d" Hosts are ready.'
+                  % (game_monitor.monitor.name, len(host_list)))
+        return len(host_list) > 0
+
+    def next_host(self, game_monitor):
+        with self.lock:
+            dispatch_game = self._get_game(game_monitor.game_id)
+            host_queue = dispatch_game.queues.get(game_monitor.id, None)
+            while True:
+                if not host_queue:
+                    if not self._rebuild(dispatch_game, game_monitor):
+                        return None
+                    host_queue = dispatch_game.queues[game_monitor.id]
+                host_id = host_queue.popleft()
+                if host_id in dispatch_game.ready:
+                    dispatch_game.ready.discard(host_id)
+                    return host_id
+
+    def invalidate(self, game_id=None):
+        with self.lock:
+            if game_id is None:
+                self.games.clear()
+            else:
+                self.games.pop(game_id, None)
+
+
+JOB_DISPATCH = JobDispatch()
@@ -0,0 +1,178 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import threading
+
+from collections import deque
+from django.conf import settings
+from scorebot.utils.logger import log_debug, log_error
+from scorebot.utils.constants import CONST_CORE_DUMP_QUEUE_SIZE, CONST_CORE_DUMP_FLUSH_TIME, \
+    CONST_CORE_DUMP_SEGMENT_SIZE, CONST_CORE_DUMP_SIZE_MAX
+
+DUMP_FILE_PREFIX = 'dump-'
+DUMP_FILE_SUFFIX = '.jsonl.gz'
+
+
+def read_dumps(dump_dir, dump_name=None):
+    """
+    Reads the dump records from the segments in "dump_dir", oldest segment first.  Each record is a dict with "time",
+    "name" and "data".  If "dump_name" is set only records with names starting with it are returned.  A segment that
+    is still being written is read up to the last complete record.
+    """
+    if not os.path.isdir(dump_dir):
+        return
+    for dump_file in get_segments(dump_dir):
+        try:
+            with gzip.open(dump_file, 'rt', encoding='UTF-8') as dump_segment:
+                for dump_line in dump_segment:
+                    try:
+                        dump_record = json.loads(dump_line)
+                    except ValueError:
+                        continue
+                    if dump_name is None or str(dump_record.get('name', '')).startswith(dump_name):
+                        yield dump_record
+        except (EOFError, OSError):
+            pass
+
+
+def get_segments(dump_dir):
+    dump_files = [os.path.join(dump_dir, f) for f in os.listdir(dump_dir)
+                  if f.startswith(DUMP_FILE_PREFIX) and f.endswith(DUMP_FILE_SUFFIX)]
+    dump_files.sort(key=lambda f: (os.path.getmtime(f), f))
+    return dump_files
+
+
+class DumpArchive(object):
+    """
+    Scorebot v3: DumpArchive
+
+    Background writer for the request/response dumps.  Dumps are queued and appended by a background thread to a
+    compressed JSON lines segment in "DUMP_DIR" every "flush_time" seconds.  A segment is closed once "segment_size"
+    bytes have been written to it, and the oldest segments are deleted when the segments use more than "size_max"
+    bytes on disk.  Segment names include the process ID, so every process writes its own segments.  When the queue
+    is full the oldest waiting dump is dropped.
+    """
+
+    def __init__(self, name, size=CONST_CORE_DUMP_QUEUE_SIZE, flush_time=CONST_CORE_DUMP_FLUSH_TIME,
+                 segment_size=CONST_CORE_DUMP_SEGMENT_SIZE, size_max=CONST_CORE_DUMP_SIZE_MAX):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        self.name = name
+        self.size = size
+        self.size_max = size_max
+        self.flush_time = flush_time
+        self.segment_size = segment_size
+        self.added = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = 0
+        self.thread = None
+        self.segment = None
+        self.segment_path = None
+        self.segment_written = 0
+        self.dumps = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.dumps)
+
+    def put(self, dump_name, dump_data):
+        if self.thread is None:
+            self.start()
+        dump_line = json.dumps({'time': time.time(), 'name': dump_name, 'data': dump_data}, default=str)
+        with self.lock:
+            if len(self.dumps) >= self.size:
+                self.dumps.popleft()
+                self.dropped += 1
+            self.dumps.append(dump_line)
+            self.added += 1
+        del dump_line
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='%s-writer' % self.name.lower(), daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_time)
+            try:
+                self.flush()
+            except Exception as flushError:
+                log_error('DUMP', 'Writing to the dump archive failed! (%s)' % str(flushError))
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if len(self.dumps) == 0:
+                    return 0
+                dump_lines = list(self.dumps)
+                self.dumps.clear()
+            if self.segment is None:
+                self._open()
+            dump_data = ('%s\n' % '\n'.join(dump_lines)).encode('UTF-8')
+            try:
+                self.segment.write(dump_data)
+                self.segment.flush()
+            except OSError:
+                with self.lock:
+                    self.dropped += len(dump_lines)
+                self._close()
+                raise
+            self.segment_written += len(dump_data)
+            with self.lock:
+                self.written += len(dump_lines)
+            if self.segment_written >= self.segment_size:
+                self._close()
+                self._prune()
+            del dump_data
+            return len(dump_lines)
+
+    def close(self):
+        self.flush()
+        with self.flush_lock:
+            self._close()
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'depth': len(self.dumps), 'size': self.size, 'added': self.added,
+                    'dropped': self.dropped, 'written': self.written, 'segments': self.segments,
+                    'segment': self.segment_path, 'segment_written': self.segment_written}
+
+    def _open(self):
+        if not os.path.isdir(settings.DUMP_DIR):
+            os.makedirs(settings.DUMP_DIR, exist_ok=True)
+        self.segments += 1
+        self.segment_path = os.path.join(settings.DUMP_DIR, '%s%s-%d-%d%s' % (
+            DUMP_FILE_PREFIX, time.strftime('%Y%m%d-%H%M%S'), os.getpid(), self.segments, DUMP_FILE_SUFFIX))
+        self.segment = gzip.open(self.segment_path, 'ab')
+        self.segment_written = 0
+        log_debug('DUMP', 'Opened dump segment "%s".' % self.segment_path)
+
+    def _close(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def _prune(self):
+        dump_files = get_segments(settings.DUMP_DIR)
+        dump_size = sum(os.path.getsize(f) for f in dump_files)
+        for dump_file in dump_files:
+            if dump_size <= self.size_max:
+                break
+            if dump_file == self.segment_path and self.segment is not None:
+                continue
+            dump_size -= os.path.getsize(dump_file)
+            os.remove(dump_file)
+            log_debug('DUMP', 'Removed dump segment "%s" to stay under the size limit.' % dump_file)
+        del dump_size
+        del dump_files
+
+
+DUMP_ARCHIVE = DumpArchive('DUMP')
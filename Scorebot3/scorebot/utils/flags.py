@@ -0,0 +1,64 @@
+import time
+import threading
+
+from scorebot.utils.logger import log_debug
+from scorebot.utils.constants import CONST_GRID_FLAG_INDEX_TIMEOUT
+
+
+class FlagIndex(object):
+    """
+    Scorebot v3: FlagIndex
+
+    Per-Game map of flag values to the enabled Flags that use them, stored as [flag id, owning team id, capturing
+    team id].  Flag submissions are resolved against this map so guesses do not hit the database.  A Game's map is
+    dropped when one of its Flags is saved or deleted and is rebuilt with a single query on the next lookup.  Maps
+    also expire after "timeout" seconds, as Flags can be changed by another process.  Captures must still be claimed
+    with a conditional update, the map only answers which Flag a value belongs to.
+    """
+
+    def __init__(self, timeout=CONST_GRID_FLAG_INDEX_TIMEOUT):
+        self.games = dict()
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def _rebuild(self, game_id):
+        from scorebot_grid.models import Flag
+        flag_map = dict()
+        flag_ids = dict()
+        for flag_value, flag_id, team_id, captured_id in Flag.objects.filter(
+                host__team__game_id=game_id, enabled=True).values_list('flag', 'id', 'team_id', 'captured_id'):
+            flag_ids[flag_id] = [flag_id, team_id, captured_id]
+            flag_map.setdefault(flag_value, list()).append(flag_ids[flag_id])
+        self.games[game_id] = (time.monotonic(), flag_map, flag_ids)
+        log_debug('FLAG', 'Rebuilt the Flag index for Game "%d", "%d" Flag values loaded.' % (game_id, len(flag_map)))
+        return flag_map
+
+    def get_flag(self, game_id, team_id, flag_value):
+        with self.lock:
+            try:
+                built, flag_map, flag_ids = self.games[game_id]
+                if (time.monotonic() - built) > self.timeout:
+                    flag_map = self._rebuild(game_id)
+            except KeyError:
+                flag_map = self._rebuild(game_id)
+            flags = [f for f in flag_map.get(flag_value, []) if f[1] != team_id]
+            if len(flags) != 1:
+                return None, None
+            return flags[0][0], flags[0][2]
+
+    def set_captured(self, game_id, flag_id, captured_id):
+        with self.lock:
+            try:
+                self.games[game_id][2][flag_id][2] = captured_id
+            except KeyError:
+                pass
+
+    def invalidate(self, game_id=None):
+        with self.lock:
+            if game_id is None:
+                self.games.clear()
+            else:
+                self.games.pop(game_id, None)
+
+
+FLAG_INDEX = FlagIndex()
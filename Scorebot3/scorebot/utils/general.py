@@ -1,4 +1,3 @@
-import os
 import json
 import uuid
 import inspect
@@ -7,22 +6,22 @@ import scorebot.utils
 from django.db import models
 from django.conf import settings
 from django.contrib import admin
-from django.utils import timezone
 from scorebot_game.models import GameTeam
 from scorebot_api import admin as sbe_admin
 from django.core.handlers.wsgi import WSGIRequest
 from scorebot_core.models import AccessToken, Token
+from scorebot.utils.dumps import DUMP_ARCHIVE
 from scorebot.utils.logger import log_debug, log_error
 from scorebot.utils.constants import CONST_GAME_GAME_RUNNING
-from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, HttpResponse
 
 try:
     from ipware.ip import get_ip
 except ImportError:
-    log_error('BACKEND', 'Django IPware is missing, all IP address lookups will return fake data. '
+    log_error('BACKEND', 'Django IPware is missing, all IP address lookups will only use the connection address. '
                          'Please use "pip install django-ipware" to install the plugin.')
 
-    def get_ip(request): return 'ERR-DJANGO-IPWARE-MISSING'
+    def get_ip(request): return request.META.get('REMOTE_ADDR', 'ERR-DJANGO-IPWARE-MISSING')
 
 
 _MODELS_REGISTERED = []
@@ -33,6 +32,20 @@ def get_client_ip(request):
     return get_ip(request)
 
 
+def get_client_address(request):
+    # The "X-Forwarded-For" header is only used when it was added by one of the proxies in "SBE_PROXIES", reading it
+    # from the right so that entries added by the client itself are never used.
+    client = request.META.get('REMOTE_ADDR', 'ERR-NO-ADDRESS')
+    proxies = getattr(settings, 'SBE_PROXIES', None)
+    if proxies and client in proxies and 'HTTP_X_FORWARDED_FOR' in request.META:
+        forwarded = [a.strip() for a in request.META['HTTP_X_FORWARDED_FOR'].split(',') if len(a.strip()) > 0]
+        while client in proxies and len(forwarded) > 0:
+            client = forwarded.pop()
+        del forwarded
+    del proxies
+    return client
+
+
 def authenticate(requires=None):
     def _authenticate_wrapper(auth_function):
         def _authenticate_wrapped(*args, **kwargs):
@@ -55,8 +68,7 @@ def authenticate(requires=None):
                           http_ip)
                 return HttpResponseForbidden(content='{"message": "SBE API: Missing authentication header!"}')
             try:
-                http_request.authentication = AccessToken.objects.get(
-                    token__uuid=uuid.UUID(http_request.META['HTTP_SBE_AUTH']))
+                http_request.authentication = AccessToken.get_token(uuid.UUID(http_request.META['HTTP_SBE_AUTH']))
             except ValueError:
                 log_error('API',
                           'AUTH (%s): Attempted to connect with an invalid authentication token format "%s"!'
@@ -104,14 +116,7 @@ def dump_data(dump_name, data_to_dump):
     if dump_name is None or data_to_dump is None:
         return
     if settings.DUMP_DATA:
-        try:
-            if not os.path.exists(settings.DUMP_DIR):
-                os.mkdir(settings.DUMP_DIR)
-            dump_file = open('dump-%s-%s' % (dump_name, timezone.now().strftime('%m.%d.%y-%H.%M.%S')), 'w')
-            dump_file.write(str(data_to_dump))
-            dump_file.closed()
-        except:
-            pass
+        DUMP_ARCHIVE.put(dump_name, data_to_dump)
 
 
 def import_all_models(models_class, models_ignore=list()):
@@ -133,8 +138,9 @@ def import_all_models(models_class, models_ignore=list()):
                         _MODELS_REGISTERED.append(model_class_object[1])
 
 
-def game_team_from_token(request, api_name, json_field, offense=True, beacon=False, fields=None):
+def game_team_from_token(request, api_name, json_field, offense=True, beacon=False, fields=None, limiter=None):
     client = get_ip(request)
+    address = get_client_address(request)
     try:
         decoded_data = request.body.decode('UTF-8')
     except UnicodeDecodeError:
@@ -156,15 +162,22 @@ def game_team_from_token(request, api_name, json_field, offense=True, beacon=Fal
                 log_error('API', '%s (%s): Data submitted is missing field "%s"!' % (api_name.upper(), client, field))
                 return None, None, None, HttpResponseBadRequest(
                     content='{"message": "SBE API: Missing JSON field \'%s\'!"}' % field)
+    if limiter is not None and not limiter.allow_client(address):
+        return None, None, None, HttpResponse(status=429,
+                                              content='{"message": "SBE API: Too many requests, slow down!"}')
     log_debug('API', '%s (%s): Team Token submitted is "%s"!' % (api_name.upper(), client, json_data[json_field]))
     try:
         token = Token.objects.get(uuid=uuid.UUID(json_data[json_field]))
     except ValueError:
         log_error('API', '%s (%s): Team Token submitted is not a valid format!' % (api_name.upper(), client))
+        if limiter is not None:
+            limiter.bad_client(address)
         return None, None, None, HttpResponseForbidden(
             content='{"message": "SBE API: Team Token is not a valid format!"}')
     except Token.DoesNotExist:
         log_error('API', '%s (%s): Team Token submitted does not exist!' % (api_name.upper(), client))
+        if limiter is not None:
+            limiter.bad_client(address)
         return None, None, None, HttpResponseForbidden(content='{"message": "SBE API: Team Token is not valid!"}')
     except Token.MultipleObjectsReturned:
         log_error('API', '%s (%s): Team Token submitted returns multiple objects, must be invalid!'
@@ -183,6 +196,8 @@ def game_team_from_token(request, api_name, json_field, offense=True, beacon=Fal
             team = GameTeam.objects.get(token=token)
     except GameTeam.DoesNotExist:
         log_error('API', '%s (%s): Token submitted is not linked to a Team!' % (api_name.upper(), client))
+        if limiter is not None:
+            limiter.bad_client(address)
         return None, None, None, HttpResponseForbidden(content='{"message": "SBE API: Not a Team Token!"}')
     except GameTeam.MultipleObjectsReturned:
         log_error('API', '%s (%s): Token submitted by matched multiple Teams, must be invalid!'
@@ -200,5 +215,10 @@ def game_team_from_token(request, api_name, json_field, offense=True, beacon=Fal
         log_error('API', '%s (%s): Game "%s" submitted is not Running!' % (api_name.upper(), client, team.game.name))
         return None, None, None, HttpResponseForbidden(content='{"message": "SBE API: Team Game "%s" is not Running!"}'
                                                                % team.game.name)
+    if limiter is not None:
+        limiter.configure(team.id, team.game, team.get_canonical_name())
+        if not limiter.allow(team.id):
+            return None, None, None, HttpResponse(status=429,
+                                                  content='{"message": "SBE API: Too many requests, slow down!"}')
     del decoded_data
     return team, token, json_data, None
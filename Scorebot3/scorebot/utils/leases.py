@@ -0,0 +1,93 @@
+import time
+import math
+import threading
+
+from scorebot.utils.constants import CONST_GAME_LEASE_SLOTS, CONST_GAME_LEASE_TICK
+
+
+class LeaseWheel(object):
+    """
+    Scorebot v3: LeaseWheel
+
+    Hashed timing wheel of outstanding leases.  A lease is stored in the slot of the tick its deadline falls on, so
+    adding, removing and expiring a lease does not depend on the number of leases held.  Calling "expire" walks the
+    slots passed since the last call and returns the data of every lease whose deadline has been reached.  Deadlines
+    further away than one turn of the wheel stay in their slot until the tick is reached.  The wheel is local to the
+    process, the database stays the authority for the leases.
+    """
+
+    def __init__(self, name, slots=CONST_GAME_LEASE_SLOTS, tick=CONST_GAME_LEASE_TICK):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        if not isinstance(slots, int) or slots <= 0:
+            raise ValueError('Parameter "slots" must be a positive "integer" object type!')
+        self.name = name
+        self.tick = tick
+        self.added = 0
+        self.removed = 0
+        self.expired = 0
+        self.current = None
+        self.leases = dict()
+        self.slots = [dict() for _ in range(0, slots)]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.leases)
+
+    def add(self, lease_id, deadline, lease_data):
+        with self.lock:
+            if self.current is None:
+                self.current = math.floor(time.time() / self.tick)
+            self._remove(lease_id)
+            lease_tick = max(math.ceil(deadline / self.tick), self.current + 1)
+            self.slots[lease_tick % len(self.slots)][lease_id] = (lease_tick, lease_data)
+            self.leases[lease_id] = lease_tick
+            self.added += 1
+
+    def remove(self, lease_id):
+        with self.lock:
+            if self._remove(lease_id):
+                self.removed += 1
+                return True
+            return False
+
+    def expire(self, now=None):
+        now_tick = math.floor((now if now is not None else time.time()) / self.tick)
+        expired = list()
+        with self.lock:
+            if self.current is None or now_tick <= self.current:
+                if self.current is None:
+                    self.current = now_tick
+                return expired
+            if now_tick - self.current >= len(self.slots):
+                expire_ticks = range(0, len(self.slots))
+            else:
+                expire_ticks = range(self.current + 1, now_tick + 1)
+            for expire_tick in expire_ticks:
+                expire_slot = self.slots[expire_tick % len(self.slots)]
+                if len(expire_slot) == 0:
+                    continue
+                for lease_id, (lease_tick, lease_data) in list(expire_slot.items()):
+                    if lease_tick <= now_tick:
+                        del expire_slot[lease_id]
+                        del self.leases[lease_id]
+                        expired.append(lease_data)
+            self.current = now_tick
+            self.expired += len(expired)
+        del now_tick
+        return expired
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'leases': len(self.leases), 'slots': len(self.slots), 'added': self.added,
+                    'removed': self.removed, 'expired': self.expired}
+
+    def _remove(self, lease_id):
+        lease_tick = self.leases.pop(lease_id, None)
+        if lease_tick is None:
+            return False
+        self.slots[lease_tick % len(self.slots)].pop(lease_id, None)
+        return True
+
+
+JOB_LEASES = LeaseWheel('JobLease')
@@ -0,0 +1,152 @@
+import time
+import threading
+
+from django.conf import settings
+from collections import OrderedDict, deque
+from scorebot.utils.constants import CONST_CORE_LIMIT_SIZE, CONST_CORE_LIMIT_WINDOW, CONST_CORE_LIMIT_HISTORY, \
+    CONST_GAME_GAME_OPTIONS_DEFAULTS, CONST_CORE_LIMIT_CLIENT_RATE, CONST_CORE_LIMIT_CLIENT_BURST
+
+
+class TokenBucket(object):
+    """
+    Scorebot v3: TokenBucket
+
+    Refills "rate" tokens per second up to "burst" tokens, each allowed request takes one token.  Also keeps the
+    recent rejected and bad requests made with this bucket's key for the admin counters.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.label = None
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.history = deque(maxlen=CONST_CORE_LIMIT_HISTORY)
+
+    def take(self, now):
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def count(self, now, window):
+        while len(self.history) > 0 and (now - self.history[0][0]) > window:
+            self.history.popleft()
+        rejected = sum(1 for h in self.history if h[1])
+        return rejected, len(self.history) - rejected
+
+
+class RateLimiter(object):
+    """
+    Scorebot v3: RateLimiter
+
+    In-memory rate limiter for one API endpoint with two sets of buckets.  Every request is first checked against
+    its client address with "allow_client", before the Team token is looked up, so requests with made up tokens cost
+    a bucket per client and not a query each.  Once the Team is known the request is checked against the Team's
+    bucket with "allow", after "configure" has given the bucket its Game's rate.  The Team rate is read from the
+    "<option>_rate" (per minute) and "<option>_burst" Game options, the client rate is read from the
+    "SBE_LIMIT_CLIENT_RATE" and "SBE_LIMIT_CLIENT_BURST" settings and should be higher, as Teams can share an
+    address.  The number of keys is bounded, the least recently used key is dropped first.  The limits are per
+    process, so the effective limit is multiplied by the number of API worker processes.
+    """
+
+    def __init__(self, name, option, size=CONST_CORE_LIMIT_SIZE, window=CONST_CORE_LIMIT_WINDOW):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        if option is None:
+            raise ValueError('Parameter "option" cannot be None!')
+        self.name = name
+        self.size = size
+        self.option = option
+        self.rate = int(CONST_GAME_GAME_OPTIONS_DEFAULTS['%s_rate' % option]) / 60.0
+        self.burst = int(CONST_GAME_GAME_OPTIONS_DEFAULTS['%s_burst' % option])
+        self.client_rate = int(getattr(settings, 'SBE_LIMIT_CLIENT_RATE', CONST_CORE_LIMIT_CLIENT_RATE)) / 60.0
+        self.client_burst = int(getattr(settings, 'SBE_LIMIT_CLIENT_BURST', CONST_CORE_LIMIT_CLIENT_BURST))
+        self.window = window
+        self.bad_total = 0
+        self.allowed_total = 0
+        self.rejected_total = 0
+        self.buckets = OrderedDict()
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_bucket(self, key, buckets=None):
+        if buckets is None:
+            buckets = self.buckets
+        try:
+            bucket = buckets[key]
+            buckets.move_to_end(key)
+        except KeyError:
+            if buckets is self.clients:
+                bucket = TokenBucket(self.client_rate, self.client_burst)
+            else:
+                bucket = TokenBucket(self.rate, self.burst)
+            buckets[key] = bucket
+            while len(buckets) > self.size:
+                buckets.popitem(last=False)
+        return bucket
+
+    def _allow(self, key, buckets):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._get_bucket(key, buckets)
+            if bucket.take(now):
+                self.allowed_total += 1
+                return True
+            bucket.history.append((now, True))
+            self.rejected_total += 1
+            return False
+
+    def _bad(self, key, buckets):
+        with self.lock:
+            self._get_bucket(key, buckets).history.append((time.monotonic(), False))
+            self.bad_total += 1
+
+    def allow(self, key):
+        return self._allow(key, self.buckets)
+
+    def allow_client(self, client):
+        return self._allow(client, self.clients)
+
+    def bad(self, key):
+        self._bad(key, self.buckets)
+
+    def bad_client(self, client):
+        self._bad(client, self.clients)
+
+    def configure(self, key, game, label=None):
+        game_options = game.get_options()
+        rate = getattr(game_options, '%s_rate' % self.option) / 60.0
+        burst = getattr(game_options, '%s_burst' % self.option)
+        with self.lock:
+            bucket = self._get_bucket(key)
+            bucket.rate = rate
+            bucket.burst = burst
+            bucket.label = label
+        del rate
+        del burst
+        del game_options
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            keys = list()
+            for key, bucket in self.buckets.items():
+                rejected, bad = bucket.count(now, self.window)
+                if rejected > 0 or bad > 0:
+                    keys.append({'key': key, 'team': bucket.label, 'rejected': rejected, 'bad': bad,
+                                 'rate': bucket.rate, 'burst': bucket.burst})
+            for client, bucket in self.clients.items():
+                rejected, bad = bucket.count(now, self.window)
+                if rejected > 0 or bad > 0:
+                    keys.append({'key': client, 'team': None, 'rejected': rejected, 'bad': bad,
+                                 'rate': bucket.rate, 'burst': bucket.burst})
+            return {'name': self.name, 'keys': len(self.buckets), 'clients': len(self.clients), 'window': self.window,
+                    'allowed': self.allowed_total, 'rejected': self.rejected_total, 'bad': self.bad_total,
+                    'offenders': sorted(keys, key=lambda k: k['rejected'] + k['bad'], reverse=True)}
+
+
+FLAG_LIMITER = RateLimiter('Flag', 'flag')
+BEACON_LIMITER = RateLimiter('Beacon', 'beacon')
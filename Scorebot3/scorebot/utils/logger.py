@@ -1,6 +1,9 @@
 import os
+import queue
+import atexit
 import logging
 import logging.config
+import logging.handlers
 
 LOG_HANDLES = dict()
 
@@ -9,7 +12,32 @@ LOGGER_DEFAULT_LEVEL = 'DEBUG'
 LOGGER_DEFAULT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
 
 
+class LogRouter(logging.Handler):
+    """
+    Scorebot v3: LogRouter
+
+    Handler used by the Logger writer thread, passes each record to the file handler of the log it was written to.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.log_files = dict()
+
+    def emit(self, record):
+        log_file = self.log_files.get(record.name, None)
+        if log_file is not None:
+            log_file.handle(record)
+
+
 class Logger(object):
+    """
+    Scorebot v3: Logger
+
+    Writes each named log to its own file in "log_directory".  Log calls only put the record on a queue, the files
+    are written by a single background thread so callers never wait on the disk.  The queue is written out when the
+    process exits.
+    """
+
     def __init__(self, log_directory):
         if log_directory is None:
             raise ValueError('Parameter "log_directory" cannot be None!')
@@ -23,36 +51,56 @@ class Logger(object):
             #raise OSError('Parameter "log_directory" is not a directory!')
         self.log_handles = dict()
         self.log_dir = log_directory
+        self.log_queue = queue.Queue()
+        self.log_router = LogRouter()
+        self.log_writer = logging.handlers.QueueListener(self.log_queue, self.log_router)
+        self.log_writer.start()
+        atexit.register(self.log_writer.stop)
+
+    def info(self, log_name, log_message, *log_args):
+        if log_name not in self.log_handles:
+            self.setup_log(log_name)
+        self.log_handles[log_name].info(log_message, *log_args)
+
+    def error(self, log_name, log_message, *log_args):
+        if log_name not in self.log_handles:
+            self.setup_log(log_name)
+        self.log_handles[log_name].error(log_message, *log_args)
 
-    def info(self, log_name, log_message):
+    def debug(self, log_name, log_message, *log_args):
         if log_name not in self.log_handles:
             self.setup_log(log_name)
-        self.log_handles[log_name].info(log_message)
+        self.log_handles[log_name].debug(log_message, *log_args)
 
-    def error(self, log_name, log_message):
+    def warning(self, log_name, log_message, *log_args):
         if log_name not in self.log_handles:
             self.setup_log(log_name)
-        self.log_handles[log_name].error(log_message)
+        self.log_handles[log_name].warning(log_message, *log_args)
 
-    def debug(self, log_name, log_message):
+    def log(self, log_name, log_level, log_message, *log_args):
         if log_name not in self.log_handles:
             self.setup_log(log_name)
-        self.log_handles[log_name].debug(log_message)
+        self.log_handles[log_name].log(log_level, log_message, *log_args)
 
-    def warning(self, log_name, log_message):
+    def enabled(self, log_name, log_level):
         if log_name not in self.log_handles:
             self.setup_log(log_name)
-        self.log_handles[log_name].warning(log_message)
+        return self.log_handles[log_name].isEnabledFor(log_level)
+
+    def write(self, log_name, log_lines):
+        with open(os.path.join(self.log_dir, '%s.log' % log_name.lower()), 'a') as log_file:
+            log_file.write('%s\n' % '\n'.join(log_lines))
 
-    def setup_log(self, log_name, log_level=LOGGER_DEFAULT_LEVEL, log_format=LOGGER_DEFAULT_FORMAT):
+    def setup_log(self, log_name, log_level=None, log_format=LOGGER_DEFAULT_FORMAT):
         log_handler = logging.FileHandler(os.path.join(self.log_dir, '%s.log' % log_name.lower()))
         log_handler.setFormatter(logging.Formatter(log_format))
+        self.log_router.log_files[log_name] = log_handler
         log_logger = logging.getLogger(log_name)
-        log_logger.setLevel(log_level)
-        log_logger.addHandler(log_handler)
+        log_logger.setLevel(log_level if log_level is not None else LOGGER_DEFAULT_LEVEL)
+        log_logger.addHandler(logging.handlers.QueueHandler(self.log_queue))
         self.log_handles[log_name] = log_logger
 
-    def setup_log_stdout(self, log_name, log_level=LOGGER_DEFAULT_LEVEL, log_format=LOGGER_DEFAULT_FORMAT):
+    def setup_log_stdout(self, log_name, log_level=None, log_format=LOGGER_DEFAULT_FORMAT):
         if log_name not in self.log_handles:
             self.setup_log(log_name, log_level=log_level, log_format=log_format)
         log_stream = logging.StreamHandler()
@@ -64,28 +112,52 @@ def log_event(event_message):
     pass
 
 
-def log_info(log_name, log_message):
+def log_info(log_name, log_message, *log_args):
+    if LOGGER_INSTANCE is None:
+        print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % log_message)
+        return
+    LOGGER_INSTANCE.info(log_name, log_message, *log_args)
+
+
+def log_error(log_name, log_message, *log_args):
     if LOGGER_INSTANCE is None:
         print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % log_message)
-    LOGGER_INSTANCE.info(log_name, log_message)
+        return
+    LOGGER_INSTANCE.error(log_name, log_message, *log_args)
 
 
-def log_error(log_name, log_message):
+def log_debug(log_name, log_message, *log_args):
     if LOGGER_INSTANCE is None:
         print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % log_message)
-    LOGGER_INSTANCE.error(log_name, log_message)
+        return
+    LOGGER_INSTANCE.debug(log_name, log_message, *log_args)
 
 
-def log_debug(log_name, log_message):
+def log_warning(log_name, log_message, *log_args):
     if LOGGER_INSTANCE is None:
         print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % log_message)
-    LOGGER_INSTANCE.debug(log_name, log_message)
+        return
+    LOGGER_INSTANCE.warning(log_name, log_message, *log_args)
 
 
-def log_warning(log_name, log_message):
+def log_message(log_name, log_level, log_message, *log_args):
     if LOGGER_INSTANCE is None:
         print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % log_message)
-    LOGGER_INSTANCE.warning(log_name, log_message)
+        return
+    LOGGER_INSTANCE.log(log_name, log_level, log_message, *log_args)
+
+
+def log_enabled(log_name, log_level):
+    if LOGGER_INSTANCE is None:
+        return True
+    return LOGGER_INSTANCE.enabled(log_name, log_level)
+
+
+def log_write(log_name, log_lines):
+    if LOGGER_INSTANCE is None:
+        print('[!] Logger is not initialized yet! Please initialize it!\n[+] %s' % '\n[+] '.join(log_lines))
+        return
+    LOGGER_INSTANCE.write(log_name, log_lines)
 
 
 def log_init(log_directory, log_default=None):
@@ -101,7 +173,7 @@ def log_score(score_event, message, score_object=None):
     pass
 
 
-def log_stdout(log_name, log_level=LOGGER_DEFAULT_LEVEL, log_format=LOGGER_DEFAULT_FORMAT):
+def log_stdout(log_name, log_level=None, log_format=LOGGER_DEFAULT_FORMAT):
     if LOGGER_INSTANCE is not None:
         LOGGER_INSTANCE.setup_log_stdout(log_name, log_level, log_format)
 
@@ -0,0 +1,125 @@
+import time
+import atexit
+import threading
+
+from collections import deque, namedtuple
+from scorebot.utils.logger import log_write, log_error
+from scorebot.utils.constants import CONST_CORE_SCORE_QUEUE_SIZE, CONST_CORE_SCORE_QUEUE_BATCH, \
+    CONST_CORE_SCORE_QUEUE_FLUSH_TIME, CONST_CORE_SCORE_QUEUE_POLICY, CONST_CORE_SCORE_QUEUE_POLICIES
+
+ScoreEvent = namedtuple('ScoreEvent', ['time', 'id', 'type', 'name', 'value', 'data'])
+
+
+class ScoreQueue(object):
+    """
+    Scorebot v3: ScoreQueue
+
+    Bounded, thread safe queue of ScoreEvents waiting to be written to the score log.  Events are written in batches
+    by a background thread every "flush_time" seconds, or sooner once a full batch is waiting.  When the queue is full
+    the overflow policy decides which event is lost, "drop-oldest" removes the oldest waiting event and "drop-newest"
+    refuses the new event.  Every lost event is counted in "dropped".
+    """
+
+    def __init__(self, name, size=CONST_CORE_SCORE_QUEUE_SIZE, batch=CONST_CORE_SCORE_QUEUE_BATCH,
+                 flush_time=CONST_CORE_SCORE_QUEUE_FLUSH_TIME, policy=CONST_CORE_SCORE_QUEUE_POLICY):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        if policy not in CONST_CORE_SCORE_QUEUE_POLICIES:
+            raise ValueError('Parameter "policy" must be one of "%s"!' % ', '.join(CONST_CORE_SCORE_QUEUE_POLICIES))
+        self.name = name
+        self.size = size
+        self.batch = batch
+        self.policy = policy
+        self.flush_time = flush_time
+        self.added = 0
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.flush_last = 0.0
+        self.flush_max = 0.0
+        self.flush_total = 0.0
+        self.thread = None
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def __len__(self):
+        return len(self.events)
+
+    def put(self, score_event):
+        if self.thread is None:
+            self.start()
+        with self.lock:
+            if len(self.events) >= self.size:
+                self.dropped += 1
+                if self.policy == 'drop-newest':
+                    return False
+                self.events.popleft()
+            self.events.append(score_event)
+            self.added += 1
+            if len(self.events) >= self.batch:
+                self.ready.set()
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='%s-writer' % self.name.lower(), daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.ready.wait(self.flush_time)
+            self.ready.clear()
+            try:
+                self.flush()
+            except Exception as flushError:
+                log_error('SCORE-QUEUE', 'Writing to the score log failed! (%s)' % str(flushError))
+
+    def flush(self):
+        with self.flush_lock:
+            flush_start = time.monotonic()
+            flush_count = 0
+            while True:
+                with self.lock:
+                    if len(self.events) == 0:
+                        break
+                    batch = [self.events.popleft() for _ in range(min(self.batch, len(self.events)))]
+                try:
+                    log_write(self.name, [ScoreQueue.format_event(e) for e in batch])
+                except OSError:
+                    with self.lock:
+                        self.dropped += len(batch)
+                    raise
+                flush_count += len(batch)
+                del batch
+            if flush_count > 0:
+                flush_time = time.monotonic() - flush_start
+                with self.lock:
+                    self.flushes += 1
+                    self.written += flush_count
+                    self.flush_last = flush_time
+                    self.flush_total += flush_time
+                    self.flush_max = max(self.flush_max, flush_time)
+                del flush_time
+            del flush_start
+            return flush_count
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'depth': len(self.events), 'size': self.size, 'policy': self.policy,
+                    'added': self.added, 'dropped': self.dropped, 'written': self.written, 'flushes': self.flushes,
+                    'flush_last': self.flush_last, 'flush_max': self.flush_max,
+                    'flush_average': (self.flush_total / self.flushes if self.flushes > 0 else 0.0)}
+
+    @staticmethod
+    def format_event(score_event):
+        return '%s,%03d [INFO] SCORING: %s,%s,%s,%s,%s' % (
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(score_event.time)), (score_event.time % 1) * 1000,
+            score_event.id, score_event.type, score_event.name, score_event.value, score_event.data)
+
+
+SCORE_QUEUE = ScoreQueue('SCORING')
@@ -0,0 +1,70 @@
+import threading
+
+
+class StreamSlots(object):
+    """
+    Scorebot v3: StreamSlots
+
+    Caps the number of requests in this process that are allowed to hold a worker while waiting on new data (the
+    scoreboard long-poll and event stream).  Slots are taken without blocking, a request that does not get a slot
+    has to answer right away instead of waiting.  Waiting requests need a threaded server, each one holds a worker
+    thread until it finishes, so "size" must stay well under the number of threads of the process.
+    """
+
+    def __init__(self, name, size):
+        if name is None:
+            raise ValueError('Parameter "name" cannot be None!')
+        if not isinstance(size, int) or size < 0:
+            raise ValueError('Parameter "size" must be a positive "integer" object type!')
+        self.name = name
+        self.size = size
+        self.active = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.active >= self.size:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            if self.active > 0:
+                self.active -= 1
+
+    def stats(self):
+        with self.lock:
+            return {'name': self.name, 'size': self.size, 'active': self.active, 'rejected': self.rejected}
+
+
+class SlotStream(object):
+    """
+    Scorebot v3: SlotStream
+
+    Iterator wrapper for a streaming response that holds a StreamSlots slot.  The slot is given back when the
+    response is closed, even if the stream was never started.
+    """
+
+    def __init__(self, stream, slots):
+        if stream is None:
+            raise ValueError('Parameter "stream" cannot be None!')
+        if slots is None:
+            raise ValueError('Parameter "slots" cannot be None!')
+        self.slots = slots
+        self.stream = stream
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.stream)
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.slots.release()
+        self.stream.close()
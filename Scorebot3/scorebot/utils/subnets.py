@@ -0,0 +1,88 @@
+import time
+import threading
+
+from scorebot.utils.logger import log_debug, log_warning
+from netaddr import IPNetwork, IPAddress, AddrFormatError
+from scorebot.utils.constants import CONST_GAME_SUBNET_INDEX_TIMEOUT
+
+
+class SubnetGame(object):
+    """
+    Scorebot v3: SubnetGame
+
+    The address index of a single Game.  "networks" maps an (IP version, prefix length) pair to a dict of network
+    addresses (as integers) to Team IDs, "prefixes" lists those pairs from the longest prefix to the shortest and
+    "hosts" maps a normalized address to the IDs of the Hosts that use it.
+    """
+
+    def __init__(self):
+        self.hosts = dict()
+        self.prefixes = list()
+        self.networks = dict()
+        self.built = time.monotonic()
+
+
+class SubnetIndex(object):
+    """
+    Scorebot v3: SubnetIndex
+
+    Per-Game longest prefix match index over the GameTeam subnets and Host addresses, used to resolve a beacon
+    address to the target Team and Host without a query.  A Game's index is dropped when a GameTeam or Host in it is
+    saved or deleted, and is rebuilt with two queries on the next lookup.  Indexes also expire after "timeout"
+    seconds as the Teams and Hosts can be changed by another process.
+    """
+
+    def __init__(self, timeout=CONST_GAME_SUBNET_INDEX_TIMEOUT):
+        self.games = dict()
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def _rebuild(self, game_id):
+        from scorebot_grid.models import Host
+        from scorebot_game.models import GameTeam
+        subnet_game = SubnetGame()
+        for team_id, team_subnet in GameTeam.objects.filter(game_id=game_id).values_list('id', 'subnet'):
+            try:
+                network = IPNetwork(team_subnet)
+            except (AddrFormatError, ValueError):
+                log_warning('BEACON', 'Team "%d" subnet "%s" is invalid, skipping Team!' % (team_id, team_subnet))
+                continue
+            subnet_game.networks.setdefault((network.version, network.prefixlen), dict()).setdefault(network.first,
+                                                                                                       team_id)
+            del network
+        subnet_game.prefixes = sorted(subnet_game.networks.keys(), key=lambda p: p[1], reverse=True)
+        for host_id, host_ip in Host.objects.filter(team__game_id=game_id, ip__isnull=False).values_list('id', 'ip'):
+            try:
+                subnet_game.hosts.setdefault(str(IPAddress(host_ip)), list()).append(host_id)
+            except (AddrFormatError, ValueError):
+                log_warning('BEACON', 'Host "%d" address "%s" is invalid, skipping Host!' % (host_id, host_ip))
+        self.games[game_id] = subnet_game
+        log_debug('BEACON', 'Rebuilt the subnet index for Game "%d", "%d" subnets and "%d" Host addresses loaded.'
+                  % (game_id, sum(len(n) for n in subnet_game.networks.values()), len(subnet_game.hosts)))
+        return subnet_game
+
+    def get_target(self, game_id, address):
+        with self.lock:
+            subnet_game = self.games.get(game_id, None)
+            if subnet_game is None or (time.monotonic() - subnet_game.built) > self.timeout:
+                subnet_game = self._rebuild(game_id)
+        target_team = None
+        address_bits = (32 if address.version == 4 else 128)
+        for prefix in subnet_game.prefixes:
+            if prefix[0] != address.version:
+                continue
+            target_team = subnet_game.networks[prefix].get(address.value >> (address_bits - prefix[1])
+                                                           << (address_bits - prefix[1]), None)
+            if target_team is not None:
+                break
+        return target_team, subnet_game.hosts.get(str(address), [])
+
+    def invalidate(self, game_id=None):
+        with self.lock:
+            if game_id is None:
+                self.games.clear()
+            else:
+                self.games.pop(game_id, None)
+
+
+SUBNET_INDEX = SubnetIndex()
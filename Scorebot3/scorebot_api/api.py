@@ -28,4 +28,6 @@ urlpatterns = [
     url(r'^purchase/(?P<team_id>[0-9]+)/$', ScorebotAPI.api_purchase),
     url(r'^scoreboard/(?P<game_id>[0-9]+)$', ScorebotAPI.api_scoreboard_json),
     url(r'^scoreboard/(?P<game_id>[0-9]+)/$', ScorebotAPI.api_scoreboard_json),
+    url(r'^scoreboard/(?P<game_id>[0-9]+)/stream$', ScorebotAPI.api_scoreboard_stream),
+    url(r'^scoreboard/(?P<game_id>[0-9]+)/stream/$', ScorebotAPI.api_scoreboard_stream),
 ]
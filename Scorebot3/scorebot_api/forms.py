@@ -3,6 +3,8 @@ import socket
 import random
 
 from django import forms
+from django.db import transaction, IntegrityError
+from django.core.exceptions import ValidationError
 from django.utils.text import slugify
 from scorebot.utils.events import EVENT_HOST
 from scorebot.utils import logger, constants
@@ -54,9 +56,16 @@ class Scorebot2ImportForm(forms.Form):
             if import_data.get('json_data') is not None:
                 try:
                     game_data = json.loads(import_data.get('json_data'))
-                    return Scorebot2ImportForm.convert_game(game_data)
+                    with transaction.atomic():
+                        return Scorebot2ImportForm.convert_game(game_data)
                 except json.decoder.JSONDecodeError:
                     raise Exception('Cannot import! Bad JSON format!')
+                except (IntegrityError, ValidationError) as importError:
+                    logger.error('SBE-CONVERT', 'Game import was rolled back! %s' % str(importError))
+                    self.add_error(None, 'Cannot import! The Game has duplicate Hosts or Flags on a Team! (%s)' %
+                                   (', '.join(importError.messages) if isinstance(importError, ValidationError)
+                                    else str(importError)))
+                    return None
             else:
                 raise Exception('Cannot import an empty Game!')
         except Exception as importError:
@@ -7,5 +7,6 @@ urlpatterns = [
     url(r'^scoreboard/(?P<game_id>[0-9]+)$', ScorebotAPI.api_scoreboard),
     url(r'^event_message/$', ScorebotAPI.api_event_message, name='form_event_message'),
     url(r'^scoreboard/(?P<game_id>[0-9]+)/$', ScorebotAPI.api_scoreboard, name='scoreboard'),
+    url(r'^limits/$', ScorebotAPI.api_limits, name='limits'),
     url(r'', ScorebotAPI.api_default_page)
 ]
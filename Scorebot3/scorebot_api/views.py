@@ -9,18 +9,23 @@ from scorebot_grid.models import Flag, Host
 from django.shortcuts import render, reverse
 from scorebot_api.forms import Scorebot2ImportForm, CreateEventForm, EventMessageForm
 from django.views.decorators.csrf import csrf_exempt
-from netaddr import IPNetwork, IPAddress, AddrFormatError
+from netaddr import IPAddress, AddrFormatError
 from scorebot.utils.constants import CONST_GAME_GAME_RUNNING,\
-        CONST_GRID_SERVICE_PROTOCOL_CHOICES
+        CONST_GRID_SERVICE_PROTOCOL_CHOICES, CONST_GAME_JOB_COUNT_MAX, CONST_GAME_SCORE_BEACON_ATTACKER, \
+        CONST_GAME_SCORE_TRANSFER, CONST_GAME_SCORE_PURCHASE, CONST_GAME_DELTA_POLL_WAIT
 from scorebot_core.models import Monitor, token_create_new, Token
 from django.contrib.admin.views.decorators import staff_member_required
+from scorebot.utils.flags import FLAG_INDEX
+from scorebot.utils.subnets import SUBNET_INDEX
+from scorebot.utils.checkins import CHECKIN_TABLE
+from scorebot.utils.limits import FLAG_LIMITER, BEACON_LIMITER
 from scorebot.utils.general import authenticate, game_team_from_token, dump_data
 from scorebot.utils import api_info, api_debug, api_error, api_warning, api_score, api_event
 from scorebot_game.models import GameMonitor, Job, Game, GamePort, GameTeam, GameCompromise, Purchase,\
-    GameCompromiseHost, GameTicket
+    GameCompromiseHost, GameTicket, GameDelta
 from scorebot_grid.models import Host, Service, Content
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, HttpResponse, HttpResponseNotFound,\
-    HttpResponseServerError, HttpResponseRedirect, JsonResponse
+    HttpResponseServerError, HttpResponseRedirect, JsonResponse, HttpResponseNotModified, StreamingHttpResponse
 
 
 METHOD_GET = 'GET'
@@ -38,12 +43,40 @@ class ScorebotAPI:
         except Monitor.DoesNotExist:
             api_error('JOB', 'Attempted to request a Job without Monitor permissions!', request)
             return HttpResponseForbidden('{"message": "SBE API: Only registered Monitors may request Jobs!"}')
-        game_monitors = GameMonitor.objects.filter(monitor=monitor, game__status=CONST_GAME_GAME_RUNNING)
+        game_monitors = GameMonitor.objects.filter(monitor=monitor, game__status=CONST_GAME_GAME_RUNNING)\
+            .select_related('game__options', 'monitor')
         if len(game_monitors) == 0:
             api_error('JOB', 'Monitor "%s" attempted to request a Job but is not registered in any Games!'
                       % monitor.name, request)
             return HttpResponseForbidden('{"message": "SBE API: Not registered with any running Games!"}')
         if request.method == METHOD_GET:
+            if 'count' in request.GET:
+                try:
+                    job_count = int(request.GET['count'])
+                except ValueError:
+                    api_error('JOB', 'Monitor "%s" requested an invalid Job count!' % monitor.name, request)
+                    return HttpResponseBadRequest('{"message": "SBE API: Invalid Job count!"}')
+                if job_count <= 0:
+                    api_error('JOB', 'Monitor "%s" requested an invalid Job count!' % monitor.name, request)
+                    return HttpResponseBadRequest('{"message": "SBE API: Invalid Job count!"}')
+                job_count = min(job_count, CONST_GAME_JOB_COUNT_MAX)
+                api_debug('JOB', 'Monitor "%s" is requesting "%d" Jobs and has "%d" Games to choose from!'
+                          % (monitor.name, job_count, len(game_monitors)), request)
+                job_list = list()
+                game_monitors = list(game_monitors)
+                random.shuffle(game_monitors)
+                for game_monitor in game_monitors:
+                    job_list.extend(game_monitor.create_jobs(job_count - len(job_list)))
+                    if len(job_list) >= job_count:
+                        break
+                del job_count
+                del game_monitors
+                if len(job_list) == 0:
+                    return HttpResponse(status=204, content='{"message": "SBE API: No Hosts available! Try later."}')
+                job_data = '[%s]' % ', '.join(job_list)
+                del job_list
+                dump_data('job-%s' % monitor.name, job_data)
+                return HttpResponse(status=201, content=job_data)
             games_max = len(game_monitors)
             api_debug('JOB', 'Monitor "%s" is requesting a Job and has "%d" Games to choose from!'
                       % (monitor.name, games_max), request)
@@ -73,6 +106,17 @@ class ScorebotAPI:
             except json.decoder.JSONDecodeError:
                 api_debug('JOB', 'Job submitted by Monitor "%s" is not in a valid JSON format!' % monitor.name, request)
                 return HttpResponseBadRequest('{"message": "SBE API: Not in a valid JSON format!"}')
+            if isinstance(job_json, list):
+                if len(job_json) == 0:
+                    api_error('JOB', 'Monitor "%s" submitted an empty list of Jobs!' % monitor.name, request)
+                    return HttpResponseBadRequest('{"message": "SBE API: No Jobs submitted!"}')
+                api_debug('JOB', 'Monitor "%s" is submitting "%d" Jobs!' % (monitor.name, len(job_json)), request)
+                dump_data('job-%s' % monitor.name, job_json)
+                job_results = GameMonitor.score_jobs(monitor, job_json)
+                del job_json
+                del monitor
+                del game_monitors
+                return HttpResponse(status=202, content=json.dumps(job_results))
             try:
                 job = Job.objects.get(id=int(job_json['id']))
                 if job.finish is not None:
@@ -110,25 +154,31 @@ class ScorebotAPI:
     def api_flag(request):
         if request.method != METHOD_POST:
             return HttpResponseBadRequest(content='{"message": "SBE API: Not a supported method type!"}')
-        team, token, data, exception = game_team_from_token(request, 'Flag', 'token', fields=['flag'])
+        team, token, data, exception = game_team_from_token(request, 'Flag', 'token', fields=['flag'],
+                                                            limiter=FLAG_LIMITER)
         del token
         if exception is not None:
             return exception
+        flag_id, flag_captured = FLAG_INDEX.get_flag(team.game_id, team.id, data['flag'])
+        if flag_id is None:
+            FLAG_LIMITER.bad(team.id)
+            api_error('FLAG', 'Flag submitted by Team "%s" was not found!' % team.get_canonical_name(), request)
+            return HttpResponseNotFound(content='{"message": "SBE API: Flag not valid!"}')
+        if flag_captured is not None:
+            api_error('FLAG', 'Flag "%d" submitted by Team "%s" was already captured!'
+                        % (flag_id, team.get_canonical_name()), request)
+            return HttpResponse(status=204, content='{"message": "SBE API: Flag already captured!"}')
         try:
-            flag = Flag.objects.exclude(team=team).get(host__team__game=team.game, flag__exact=data['flag'],
-                                                        enabled=True)
+            flag = Flag.objects.select_related('team__game__options').get(id=flag_id)
         except Flag.DoesNotExist:
+            FLAG_INDEX.invalidate(team.game_id)
             api_error('FLAG', 'Flag submitted by Team "%s" was not found!' % team.get_canonical_name(), request)
             return HttpResponseNotFound(content='{"message": "SBE API: Flag not valid!"}')
-        except Flag.MultipleObjectsReturned:
-            api_error('FLAG', 'Flag submitted by Team "%s" returned multiple flags!'
-                        % team.get_canonical_name(), request)
-            return HttpResponseNotFound(content='{"message": "SBE API: Flag not valid!"}')
-        if flag.captured is not None:
+        del flag_captured
+        if not flag.capture(team):
             api_error('FLAG', 'Flag "%s" submitted by Team "%s" was already captured!'
                         % (flag.get_canonical_name(), team.get_canonical_name()), request)
             return HttpResponse(status=204, content='{"message": "SBE API: Flag already captured!"}')
-        flag.capture(team)
         api_info('FLAG', 'Flag "%s" was captured by team "%s"!'
                     % (flag.get_canonical_name(), team.get_canonical_name()), request)
         try:
@@ -196,41 +246,40 @@ class ScorebotAPI:
         if request.method != METHOD_POST:
             return HttpResponseBadRequest(content='{"message": "SBE API: Not a supported method type!"}')
         team, token, data, exception = game_team_from_token(request, 'CLI', 'token', beacon=True,
-                                                            fields=['address'])
+                                                            fields=['address'], limiter=BEACON_LIMITER)
         if exception is not None:
             return exception
         address_raw = data['address']
         try:
             address = IPAddress(address_raw)
         except AddrFormatError:
+            BEACON_LIMITER.bad(team.id)
             api_error('BEACON', 'IP Reported by Team "%s" is invalid!' % team.get_canonical_name(), request)
             return HttpResponseBadRequest(content='{"message": "SBE API: Invalid IP Address!"}')
-        target_team = None
-        for sel_target_team in team.game.teams.all():
-            try:
-                target_subnet = IPNetwork(sel_target_team.subnet)
-            except AddrFormatError:
-                api_warning('BEACON', 'Team "%s" subnet is invalid, skipping Team!' % team.get_canonical_name(),
-                            request)
-                continue
-            if address in target_subnet:
-                api_debug('BEACON', 'Beacon from Team "%s" to Team "%s"\'s subnet!'
-                            % (team.get_canonical_name(), sel_target_team.get_canonical_name()), request)
-                target_team = sel_target_team
-                del target_subnet
-                break
-            del target_subnet
+        target_team_id, target_hosts = SUBNET_INDEX.get_target(team.game_id, address)
         del address
         try:
-            host = Host.objects.get(ip=address_raw, team__game__status=CONST_GAME_GAME_RUNNING)
+            if len(target_hosts) == 0:
+                raise Host.DoesNotExist()
+            if len(target_hosts) > 1:
+                raise Host.MultipleObjectsReturned()
+            beacon_id = CHECKIN_TABLE.checkin_cached(target_hosts[0], team.id, token.pk, timezone.now())
+            if beacon_id is not None:
+                api_info('BEACON', 'Team "%s" updated the Beacon on Host "%s"!'
+                         % (team.get_canonical_name(), address_raw), request)
+                del beacon_id
+                del address_raw
+                return HttpResponse()
+            host = Host.objects.select_related('team__game').get(id=target_hosts[0],
+                                                                 team__game__status=CONST_GAME_GAME_RUNNING)
             if host.team.game.id != team.game.id:
+                BEACON_LIMITER.bad(team.id)
                 api_error('BEACON', 'Host accessed by Team "%s" is not in the same game as "%s"!'
                             % (team.get_canonical_name(), host.team.get_canonical_name()), request)
                 return HttpResponseForbidden('{"message": "SBE API: Host is not in the same Game!"}')
             try:
                 beacon = host.beacons.get(beacon__finish__isnull=True, beacon__attacker=team, beacon__token=token)
-                beacon.checkin = timezone.now()
-                beacon.save()
+                CHECKIN_TABLE.checkin(host.id, team.id, token.pk, beacon.beacon_id, timezone.now())
                 api_info('BEACON', 'Team "%s" updated the Beacon on Host "%s"!'
                             % (team.get_canonical_name(), host.get_canonical_name()), request)
                 return HttpResponse()
@@ -258,10 +307,11 @@ class ScorebotAPI:
                 beacon.save()
                 beacon_host.beacon = beacon
                 beacon_host.save()
+                beacon_host.team.beacons_changed()
                 api_event(team.game, 'A Host on %s\'s network was compromised by "%s"!' %
                             (host.team.name, team.name))
-                beacon_value = int(team.game.get_option('beacon_value'))
-                team.set_beacons(beacon_value)
+                beacon_value = team.game.get_options().beacon_value
+                team.set_score(CONST_GAME_SCORE_BEACON_ATTACKER, beacon_value, beacon.id)
                 api_info('SCORING-ASYNC', 'Beacon score was applied to Team "%s"!' % team.get_canonical_name(),
                             request)
                 api_score(beacon.id, 'BEACON-ATTACKER', team.get_canonical_name(), beacon_value,
@@ -274,6 +324,14 @@ class ScorebotAPI:
                             % (team.get_canonical_name(), host.get_canonical_name()), request)
                 return HttpResponse(status=201)
         except Host.DoesNotExist:
+            target_team = None
+            if target_team_id is not None:
+                try:
+                    target_team = GameTeam.objects.get(id=target_team_id)
+                    api_debug('BEACON', 'Beacon from Team "%s" to Team "%s"\'s subnet!'
+                              % (team.get_canonical_name(), target_team.get_canonical_name()), request)
+                except GameTeam.DoesNotExist:
+                    SUBNET_INDEX.invalidate(team.game_id)
             if target_team is not None:
                 api_info('BEACON', 'Host accessed by Team "%s" does not exist! Attempting to create a faux Host!'
                             % team.get_canonical_name(), request)
@@ -292,10 +350,11 @@ class ScorebotAPI:
                 beacon.save()
                 beacon_host.beacon = beacon
                 beacon_host.save()
+                beacon_host.team.beacons_changed()
                 api_event(team.game, 'A Host on %s\'s network was compromised by "%s"!' %
                             (target_team.name, team.name))
-                beacon_value = int(team.game.get_option('beacon_value'))
-                team.set_beacons(beacon_value)
+                beacon_value = team.game.get_options().beacon_value
+                team.set_score(CONST_GAME_SCORE_BEACON_ATTACKER, beacon_value, beacon.id)
                 api_info('SCORING-ASYNC', 'Beacon score was applied to Team "%s"!' % team.get_canonical_name(),
                             request)
                 api_score(beacon.id, 'BEACON-ATTACKER', team.get_canonical_name(), beacon_value,
@@ -308,6 +367,7 @@ class ScorebotAPI:
                 del address_raw
                 return HttpResponse(status=201)
             del address_raw
+            BEACON_LIMITER.bad(team.id)
             api_error('BEACON', 'Host accessed by Team "%s" does not exist and a hosting team cannot be found!'
                         % team.get_canonical_name(), request)
             return HttpResponseNotFound('{"message": "SBE API: Host does not exist!"}')
@@ -326,6 +386,8 @@ class ScorebotAPI:
             import_form = Scorebot2ImportForm(request.POST)
             if import_form.is_valid():
                 import_game = import_form.save()
+                if import_game is None and len(import_form.errors) > 0:
+                    return render(request, 'scorebot2_import.html', {'import_form': import_form.as_table()})
                 if import_game is None:
                     return HttpResponseServerError('Error importing Game! Game is None!')
                 return HttpResponseRedirect(reverse('scorebot3:scoreboard', args=(import_game.id,)))
@@ -391,11 +453,11 @@ class ScorebotAPI:
             api_error('TRANSFER', 'Transfer teams are not in the same Game!', request)
             return HttpResponseBadRequest(content='{"message": "SBE API: Teams are not in the same Game!"}')
         if team_from is not None:
-            team_from.set_uptime(-1 * amount)
+            team_from.set_score(CONST_GAME_SCORE_TRANSFER, -1 * amount, (None if team_to is None else team_to.id))
             api_score(team_from.id, 'TRANSFER', team_from.get_canonical_name(), -1 * amount,
                         ('GoldTeam' if team_to is None else team_to.get_canonical_name()))
         if team_to is not None:
-            team_to.set_uptime(amount)
+            team_to.set_score(CONST_GAME_SCORE_TRANSFER, amount, (None if team_from is None else team_from.id))
             api_score(team_to.id, 'TRANSFER', team_to.get_canonical_name(), amount,
                         ('GoldTeam' if team_from is None else team_from.get_canonical_name()))
         return HttpResponse(status=200, content='{"message": "transferred"}')
@@ -587,7 +649,7 @@ class ScorebotAPI:
             except GameTeam.MultipleObjectsReturned:
                 api_error('STORE', 'Attempted to use a Team ID which returned multiple Teams!', request)
                 return HttpResponseNotFound('{"message": "SBE API: Team could not be found!"}')
-            rate = float(team.game.get_option('score_exchange_rate'))/100.0
+            rate = float(team.game.get_options().score_exchange_rate)/100.0
             api_debug('STORE', 'The exchange rate for Team "%s" is "%.2f"!' % (team.get_canonical_name(), rate),
                       request)
             return HttpResponse(status=200, content='{"rate": %.2f}' % rate)
@@ -627,10 +689,10 @@ class ScorebotAPI:
                         purchase = Purchase()
                         purchase.team = team
                         purchase.amount = int(float(order['price']) *
-                                              (float(team.game.get_option('score_exchange_rate'))/100.0))
+                                              (float(team.game.get_options().score_exchange_rate)/100.0))
                         purchase.item = (order['item'] if len(order['item']) < 150 else order['item'][:150])
-                        team.set_uptime(-1 * purchase.amount)
                         purchase.save()
+                        team.set_score(CONST_GAME_SCORE_PURCHASE, -1 * purchase.amount, purchase.id)
                         api_score(team.id, 'PURCHASE', team.get_canonical_name(), purchase.amount, purchase.item)
                         api_debug('STORE', 'Processed order of "%s" "%d" for team "%s"!'
                                   % (purchase.item, purchase.amount, team.get_canonical_name()), request)
@@ -651,9 +713,55 @@ class ScorebotAPI:
         if request.method != METHOD_GET:
             return HttpResponseBadRequest()
         try:
-            return HttpResponse(content=Game.objects.get(id=int(game_id)).get_json_scoreboard())
+            scoreboard_tag, scoreboard_json = Game.get_scoreboard(int(game_id))
         except Game.DoesNotExist:
             return HttpResponseNotFound()
+        if request.META.get('HTTP_IF_NONE_MATCH', None) == scoreboard_tag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content=scoreboard_json)
+        response['ETag'] = scoreboard_tag
+        response['Cache-Control'] = 'no-cache'
+        del scoreboard_tag
+        del scoreboard_json
+        return response
+
+    @staticmethod
+    def api_scoreboard_stream(request, game_id):
+        if request.method != METHOD_GET:
+            return HttpResponseBadRequest()
+        try:
+            game_id = int(game_id)
+            delta_last = request.GET.get('since', request.META.get('HTTP_LAST_EVENT_ID', None))
+            if delta_last is not None and len(delta_last) > 0:
+                delta_last = int(delta_last)
+            else:
+                delta_last = None
+        except ValueError:
+            return HttpResponseBadRequest(content='{"message": "SBE API: Invalid stream position!"}')
+        if not Game.objects.filter(id=game_id).exists():
+            return HttpResponseNotFound()
+        if 'since' in request.GET:
+            response = HttpResponse(content=GameDelta.get_poll(game_id, delta_last), content_type='application/json')
+        else:
+            stream = GameDelta.open_stream(game_id, delta_last)
+            if stream is None:
+                response = HttpResponse(status=503, content_type='application/json',
+                                        content='{"message": "SBE API: Too many streams open, poll with \'since\'!"}')
+                response['Retry-After'] = str(CONST_GAME_DELTA_POLL_WAIT)
+                del delta_last
+                return response
+            response = StreamingHttpResponse(stream, content_type='text/event-stream')
+            response['X-Accel-Buffering'] = 'no'
+            del stream
+        response['Cache-Control'] = 'no-cache'
+        del delta_last
+        return response
+
+    @staticmethod
+    @staff_member_required
+    def api_limits(request):
+        return JsonResponse([FLAG_LIMITER.stats(), BEACON_LIMITER.stats()], safe=False)
 
     @staticmethod
     @staff_member_required
@@ -1,55 +1,122 @@
 from django.utils import timezone
 
-from datetime import datetime,timedelta
+from datetime import timedelta
 from daemon import DaemonEntry
+from django.db.models import Q
 from scorebot.utils.logger import log_debug
-from scorebot_game.models import Job, GameCompromise, GameEvent
+from scorebot.utils.constants import CONST_GAME_DELTA_KEEP_TIME, CONST_GAME_CLEANUP_BATCH
+from scorebot_game.models import Job, GameCompromise, GameEvent, Game, GameDelta, GameMonitor, GameTeam
 
 
 def init_daemon():
     return DaemonEntry('cleanup', 30, daemon_cleanup, 120)
 
 
-def job_cleanup():
-    log_debug('DAEMON', 'Looking for old Jobs to cleanup..')
-    job_expired = Job.objects.filter(finish__isnull=True)
-    if job_expired is not None and len(job_expired) > 0:
-        expire_time = timezone.now()
-        for job in job_expired:
-            if job.is_expired(expire_time):
-                log_debug('DAEMON', 'Deleted stale job "%d" after passing timeout!' % job.id)
-                job.delete()
-        del expire_time
-    jobs_closed = Job.objects.filter(finish__isnull=False)
-    if jobs_closed is not None and len(jobs_closed) > 0:
-        closed_time = timezone.now()
-        for job in jobs_closed:
-            if job.can_cleanup(closed_time):
-                log_debug('DAEMON', 'Deleted finished job "%d" after cleanup timeout!' % job.id)
-                job.delete()
-        del closed_time
-    beacons_open = GameCompromise.objects.filter(finish__isnull=True)
-    log_debug('DAEMON', 'Looking for expired Beacons..')
-    if beacons_open is not None and len(beacons_open) > 0:
-        expire_time = timezone.now() - timedelta(seconds=1200)
-        for beacon in beacons_open:
-            print("beacon %s, %s, %s, %s" % (expire_time, beacon.checkin, beacon.start, beacon.finish))
-            if beacon.is_expired(expire_time):
-                log_debug('DAEMON', 'Closing an expired Beacon "%s"..' % beacon.__str__())
-                beacon.finish = expire_time
-                beacon.save()
-        del expire_time
-    events_open = GameEvent.objects.all()
-    if len(events_open) > 0:
-        expire_time = timezone.now()
-        for event in events_open:
-            if event.is_expired(expire_time):
-                event.delete()
-                log_debug('DAEMON', 'Deleting an expired Event "%s"..' % event.__str__())
-    del job_expired
-    del jobs_closed
-    del beacons_open
+def cleanup_delete(query_set, batch=CONST_GAME_CLEANUP_BATCH):
+    deleted = 0
+    while True:
+        delete_ids = list(query_set.values_list('id', flat=True)[:batch])
+        if len(delete_ids) == 0:
+            break
+        query_set.model.objects.filter(id__in=delete_ids).delete()
+        deleted += len(delete_ids)
+        if len(delete_ids) < batch:
+            break
+        del delete_ids
+    return deleted
+
+
+def lease_cleanup(game, now, batch=CONST_GAME_CLEANUP_BATCH):
+    leases_expired = 0
+    job_leases = Job.objects.filter(monitor__in=GameMonitor.objects.filter(game_id=game.id).values('id'),
+                                    finish__isnull=True, expires__lte=now)
+    while True:
+        lease_list = list(job_leases.values_list('id', 'host_id', 'monitor__game_id')[:batch])
+        if len(lease_list) == 0:
+            break
+        leases_expired += Job.expire_leases(lease_list)
+        if len(lease_list) < batch:
+            break
+        del lease_list
+    del job_leases
+    return leases_expired
+
+
+def job_cleanup(game, now):
+    game_options = game.get_options()
+    job_monitors = GameMonitor.objects.filter(game_id=game.id).values('id')
+    jobs_expired = lease_cleanup(game, now)
+    jobs_expired += cleanup_delete(Job.objects.filter(
+        monitor__in=job_monitors, finish__isnull=True,
+        start__lt=now - timedelta(seconds=game_options.job_timeout + 1200)))
+    jobs_closed = cleanup_delete(Job.objects.filter(
+        monitor__in=job_monitors, finish__lt=now - timedelta(seconds=game_options.job_cleanup_time + 1200)))
+    del game_options
+    del job_monitors
+    return jobs_expired, jobs_closed
+
+
+def beacon_cleanup(game, now, batch=CONST_GAME_CLEANUP_BATCH):
+    beacon_time = game.get_options().beacon_time
+    expire_time = now - timedelta(seconds=1200)
+    beacons_expired = GameCompromise.objects.filter(
+        attacker__in=GameTeam.objects.filter(game_id=game.id).values('id'), finish__isnull=True,
+        start__lt=expire_time - timedelta(seconds=beacon_time)).filter(
+        Q(checkin__isnull=True) | Q(checkin__lt=now - timedelta(seconds=beacon_time)))
+    beacons_closed = 0
+    beacon_teams = set()
+    while True:
+        beacon_list = list(beacons_expired.values_list('id', 'host__team_id')[:batch])
+        if len(beacon_list) == 0:
+            break
+        beacons_closed += GameCompromise.objects.filter(id__in=[b[0] for b in beacon_list], finish__isnull=True)\
+            .update(finish=expire_time)
+        for beacon_id, team_id in beacon_list:
+            if team_id is not None:
+                beacon_teams.add(team_id)
+        if len(beacon_list) < batch:
+            break
+        del beacon_list
+    if beacons_closed > 0:
+        log_debug('DAEMON', 'Closed "%d" expired Beacons in Game "%s"..' % (beacons_closed, game.name))
+        Game.update_version(game.id)
+        for team in GameTeam.objects.filter(id__in=beacon_teams):
+            team.beacons_changed()
+    del beacon_time
+    del expire_time
+    del beacon_teams
+    del beacons_expired
+    return beacons_closed
+
+
+def event_cleanup(game, now):
+    events_expired = cleanup_delete(GameEvent.objects.filter(game_id=game.id, timeout__lte=now))
+    if events_expired > 0:
+        log_debug('DAEMON', 'Deleted "%d" expired Events in Game "%s"..' % (events_expired, game.name))
+        Game.update_version(game.id)
+        GameEvent.events_changed(game.id)
+    return events_expired
+
+
+def delta_cleanup(now):
+    log_debug('DAEMON', 'Looking for old scoreboard Deltas..')
+    return cleanup_delete(GameDelta.objects.filter(date__lt=now - timedelta(seconds=CONST_GAME_DELTA_KEEP_TIME))
+                          .exclude(id=GameDelta.get_last()))
 
 
 def daemon_cleanup():
-    job_cleanup()
+    log_debug('DAEMON', 'Looking for old Jobs, expired Beacons and Events to cleanup..')
+    for game in Game.objects.all():
+        now = timezone.now()
+        jobs_expired, jobs_closed = job_cleanup(game, now)
+        beacons_closed = beacon_cleanup(game, now)
+        events_expired = event_cleanup(game, now)
+        log_debug('DAEMON', 'Cleanup of Game "%s": jobs_expired=%d, jobs_closed=%d, beacons_closed=%d, '
+                            'events_expired=%d' % (game.name, jobs_expired, jobs_closed, beacons_closed,
+                                                   events_expired))
+        del now
+        del jobs_closed
+        del jobs_expired
+        del beacons_closed
+        del events_expired
+    log_debug('DAEMON', 'Cleanup deleted "%d" old scoreboard Deltas.' % delta_cleanup(timezone.now()))
@@ -1,17 +1,13 @@
-from django.utils import timezone
-
 from daemon import DaemonEntry
-from scorebot.utils import SCORE_EVENTS
-from scorebot.utils.logger import log_info
-
-LOG_NAME = 'SCORING'
+from scorebot.utils.scorelog import SCORE_QUEUE
+from scorebot.utils.logger import log_debug
 
 
 def init_daemon():
-    return DaemonEntry('scorelog', 10, write_score_log, 30)
+    return DaemonEntry('scorelog', 10, write_score_log, 30, 'queue')
 
 
 def write_score_log():
-    for score_event in SCORE_EVENTS:
-        log_info(LOG_NAME, score_event)
-        SCORE_EVENTS.remove(score_event)
+    SCORE_QUEUE.flush()
+    log_debug('DAEMON', 'Score log queue: %s' % ', '.join(['%s=%s' % (k, v) for k, v in
+                                                              sorted(SCORE_QUEUE.stats().items())]))
@@ -14,10 +14,18 @@ TWITTER = None
 
 
 def tweet():
-    for event in GameEvent.objects.all():
-        if event.type == 0:
-            TWITTER.tweet(event.data)
-            event.delete()
+    if TWITTER is None:
+        return
+    for game_id in Game.objects.values_list('id', flat=True):
+        tweet_list = GameEvent.get_tweets(game_id)
+        if len(tweet_list) == 0:
+            continue
+        for tweet_id, tweet_data in tweet_list:
+            TWITTER.tweet(tweet_data)
+        GameEvent.objects.filter(id__in=[t[0] for t in tweet_list]).delete()
+        Game.update_version(game_id)
+        GameEvent.events_changed(game_id)
+        del tweet_list
 
 
 def init_daemon():
@@ -0,0 +1,26 @@
+import json
+
+from django.conf import settings
+from scorebot.utils.dumps import read_dumps
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Scorebot v3: readdump
+
+    Prints the records in the dump archive as JSON lines, oldest first.
+    """
+
+    help = 'Prints the records from the Scorebot3 dump archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.DUMP_DIR, help='Directory that contains the dump segments.')
+        parser.add_argument('--name', default=None, help='Only print dumps with names starting with this value.')
+        parser.add_argument('--since', type=float, default=None, help='Only print dumps made after this UNIX time.')
+
+    def handle(self, *args, **options):
+        for dump_record in read_dumps(options['dir'], options['name']):
+            if options['since'] is not None and dump_record.get('time', 0) < options['since']:
+                continue
+            self.stdout.write(json.dumps(dump_record))
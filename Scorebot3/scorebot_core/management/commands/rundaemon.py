@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from scorebot.utils.daemons import start_daemon
+from scorebot.utils.constants import CONST_CORE_DAEMON_LOCK_TIME
+
+
+class Command(BaseCommand):
+    """
+    Scorebot v3: rundaemon
+
+    Runs the SBE Daemons (scoring, cleanup, reporter, ...) in a process of their own, outside of the web server
+    processes.  Any number of these processes can be started, a leader lock in the database makes sure only one of
+    them runs the Daemons while the others wait to take over.  The Daemons only talk to the web tier through the
+    database.
+    """
+
+    help = 'Runs the Scorebot3 Daemons in their own process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lock-time', type=int, default=CONST_CORE_DAEMON_LOCK_TIME,
+                            help='Seconds the leader lock is held for before it must be renewed.')
+
+    def handle(self, *args, **options):
+        start_daemon(options['lock_time'])
@@ -1,11 +1,25 @@
 import uuid
 import random
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from datetime import timedelta
+from itertools import count
+from collections import namedtuple
 from django.utils import timezone
+from django.dispatch import receiver
 from django.contrib.auth.models import User
-from scorebot.utils.constants import CONST_GAME_GAME_TEAM_LOGO_DIR, CONST_CORE_ACCESS_KEY_LEVELS
+from django.db.models.signals import post_save, post_delete
+from scorebot.utils.cache import CacheTable
+from scorebot.utils.constants import CONST_GAME_GAME_TEAM_LOGO_DIR, CONST_CORE_ACCESS_KEY_LEVELS, \
+    CONST_CORE_ACCESS_CACHE_SIZE, CONST_CORE_ACCESS_CACHE_TIMEOUT, CONST_GAME_GAME_OPTIONS_DEFAULTS, \
+    CONST_CORE_OPTIONS_CACHE_SIZE, CONST_CORE_OPTIONS_CACHE_TIMEOUT, CONST_CORE_CREDIT_CACHE_TIMEOUT
+
+GameOptions = namedtuple('GameOptions', sorted(CONST_GAME_GAME_OPTIONS_DEFAULTS.keys()))
+
+CREDIT_CACHE = CacheTable('Credit', 1, CONST_CORE_CREDIT_CACHE_TIMEOUT)
+CREDIT_ROTATION = count()
+OPTIONS_CACHE = CacheTable('GameOptions', CONST_CORE_OPTIONS_CACHE_SIZE, CONST_CORE_OPTIONS_CACHE_TIMEOUT)
+ACCESS_TOKEN_CACHE = CacheTable('AccessToken', CONST_CORE_ACCESS_CACHE_SIZE, CONST_CORE_ACCESS_CACHE_TIMEOUT)
 
 
 def score_create_new():
@@ -22,6 +36,19 @@ def team_create_new_color():
     return random.randint(0, 0xFFFFFF)
 
 
+def get_game_options(game_id):
+    game_options = OPTIONS_CACHE.get(game_id)
+    if game_options is None:
+        options = Options.objects.filter(game__id=game_id).first()
+        if options is not None:
+            game_options = options.get_options()
+        else:
+            game_options = GameOptions(**{k: int(v) for k, v in CONST_GAME_GAME_OPTIONS_DEFAULTS.items()})
+        OPTIONS_CACHE.set(game_id, game_options)
+        del options
+    return game_options
+
+
 def token_create_new(expire_days=0):
     token_object = Token()
     if expire_days > 0:
@@ -133,21 +160,25 @@ class Score(models.Model):
     def __eq__(self, other):
         return isinstance(other, Score) and len(other) == self.__len__()
 
+    def set_score(self, score_field, score_value):
+        # Updated in the database so concurrent changes from other workers are not lost.
+        if score_field not in ('flags', 'uptime', 'tickets', 'beacons'):
+            raise ValueError('Parameter "score_field" must be a "Score" value name!')
+        Score.objects.filter(id=self.id).update(**{score_field: models.F(score_field) + score_value,
+                                                   'date': timezone.now()})
+        self.refresh_from_db(fields=['flags', 'uptime', 'tickets', 'beacons', 'date'])
+
     def set_flags(self, flags_score):
-        self.flags = self.flags + flags_score
-        self.save()
+        self.set_score('flags', flags_score)
 
     def set_uptime(self, uptime_score):
-        self.uptime = self.uptime + uptime_score
-        self.save()
+        self.set_score('uptime', uptime_score)
 
     def set_tickets(self, tickets_score):
-        self.tickets = self.tickets + tickets_score
-        self.save()
+        self.set_score('tickets', tickets_score)
 
     def set_beacons(self, beacons_score):
-        self.beacons = self.beacons + beacons_score
-        self.save()
+        self.set_score('beacons', beacons_score)
 
 
 class Credit(models.Model):
@@ -162,22 +193,19 @@ class Credit(models.Model):
         return '[Credit] %s' % self.name
 
     @staticmethod
-    def get_next_credit():
-        from scorebot_game.models import GameEvent
-        for e in GameEvent.objects.all():
-            if e.type == 1:
-                d = e.data
-                if e.timeout <= timezone.now():
-                    e.delete()
-                return d
-        credit = ''
-        try:
-            credit_selected = random.choice(Credit.objects.all())
-            if credit_selected is not None:
-                credit = credit_selected.content
-        except IndexError:
-            pass
-        return credit
+    def get_next_credit(game_id=None):
+        if game_id is not None:
+            from scorebot_game.models import GameEvent
+            event_message = GameEvent.get_window(game_id)
+            if event_message is not None:
+                return event_message
+        credits = CREDIT_CACHE.get('credits')
+        if credits is None:
+            credits = list(Credit.objects.order_by('id').values_list('content', flat=True))
+            CREDIT_CACHE.set('credits', credits)
+        if len(credits) == 0:
+            return ''
+        return credits[next(CREDIT_ROTATION) % len(credits)]
 
 
 class Player(models.Model):
@@ -245,10 +273,17 @@ class Options(models.Model):
     score_exchange_rate = models.PositiveIntegerField('Score to Coin Exchange Rate Percentage', default=100)
     ticket_max_scoring = models.PositiveSmallIntegerField('Ticket Max Scoring Time (seconds)', default=14400)
     ticket_grace_period = models.PositiveSmallIntegerField('Ticket Scoring Grace Period (seconds)', default=900)
+    flag_rate = models.PositiveSmallIntegerField('Flag Submissions per Team (per minute)', default=60)
+    flag_burst = models.PositiveSmallIntegerField('Flag Submission Burst per Team', default=20)
+    beacon_rate = models.PositiveSmallIntegerField('Beacon Requests per Team (per minute)', default=120)
+    beacon_burst = models.PositiveSmallIntegerField('Beacon Request Burst per Team', default=30)
 
     def __str__(self):
         return '[Options] %s' % self.name
 
+    def get_options(self):
+        return GameOptions(**{k: int(getattr(self, k)) for k in GameOptions._fields})
+
 
 class Monitor(models.Model):
     """
@@ -293,6 +328,14 @@ class AccessToken(models.Model):
             self.token = token_create_new()
         super(AccessToken, self).save(*args, **kwargs)
 
+    @staticmethod
+    def get_token(token_uuid):
+        access = ACCESS_TOKEN_CACHE.get(token_uuid)
+        if access is None:
+            access = AccessToken.objects.select_related('token').get(token__uuid=token_uuid)
+            ACCESS_TOKEN_CACHE.set(token_uuid, access)
+        return access
+
     def __getitem__(self, access_level):
         if isinstance(access_level, int):
             access_object = access_level
@@ -321,3 +364,64 @@ class AccessToken(models.Model):
             self.level = (self.level | (1 << access_object))
         else:
             self.level = (self.level & (~(1 << access_object)))
+
+
+class Lock(models.Model):
+    """
+    Scorebot v3: Lock
+
+    A named lease held by a single process, used to elect the leader when more than one daemon process is started.
+    The lease must be renewed before it expires, once expired it can be taken by any other process.
+    """
+
+    class Meta:
+        verbose_name = 'Lock'
+        verbose_name_plural = 'Locks'
+
+    expires = models.DateTimeField('Lock Expires')
+    owner = models.CharField('Lock Owner', max_length=255)
+    name = models.SlugField('Lock Name', max_length=150, unique=True)
+
+    def __str__(self):
+        return '[Lock] %s <%s>' % (self.name, self.owner)
+
+    @staticmethod
+    def acquire(lock_name, lock_owner, lock_time):
+        now = timezone.now()
+        lock_expires = now + timedelta(seconds=lock_time)
+        if Lock.objects.filter(name=lock_name).filter(models.Q(owner=lock_owner) | models.Q(expires__lt=now))\
+                .update(owner=lock_owner, expires=lock_expires) > 0:
+            return True
+        try:
+            with transaction.atomic():
+                Lock.objects.create(name=lock_name, owner=lock_owner, expires=lock_expires)
+            return True
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def release(lock_name, lock_owner):
+        return Lock.objects.filter(name=lock_name, owner=lock_owner).delete()[0] > 0
+
+
+# The caches are cleared from signals so that deletes done through a QuerySet (like the admin "delete selected"
+# action) are seen as well.  "QuerySet.update" does not send any signals, rows changed that way stay cached in each
+# process until the cache entry times out.
+@receiver([post_save, post_delete], sender=Token)
+def signal_token_changed(sender, instance, **kwargs):
+    ACCESS_TOKEN_CACHE.pop(instance.uuid)
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def signal_access_token_changed(sender, instance, **kwargs):
+    ACCESS_TOKEN_CACHE.clear()
+
+
+@receiver([post_save, post_delete], sender=Options)
+def signal_options_changed(sender, instance, **kwargs):
+    OPTIONS_CACHE.clear()
+
+
+@receiver([post_save, post_delete], sender=Credit)
+def signal_credit_changed(sender, instance, **kwargs):
+    CREDIT_CACHE.clear()
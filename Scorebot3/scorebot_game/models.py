@@ -1,18 +1,46 @@
 import json
 import html
+import math
+import time
 import uuid
-import random
+import hashlib
 
-from django.db import models
 from datetime import timedelta
+from functools import partial
+from django.conf import settings
 from django.utils import timezone
+from django.dispatch import receiver
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
+from django.db.models import Case, When, Sum, Count, IntegerField
+from scorebot_grid.models import Host, Flag, Service
+from scorebot.utils.bulk import BulkUpdate
+from scorebot.utils.cache import CacheTable
+from scorebot.utils.subnets import SUBNET_INDEX
+from scorebot.utils.leases import JOB_LEASES
+from scorebot.utils.streams import StreamSlots, SlotStream
+from scorebot.utils.dispatch import JOB_DISPATCH
 from django.contrib.auth.models import User
 from scorebot.utils.events import post_tweet, get_scoreboard_message
 from scorebot.utils import api_info, api_debug, api_error, api_warning, api_score, api_event
-from scorebot_core.models import Team, score_create_new, token_create_new, team_create_new_color, Credit, Token
+from scorebot_core.models import Team, score_create_new, token_create_new, team_create_new_color, Credit, Token, \
+    Score, OPTIONS_CACHE, get_game_options
 from scorebot.utils.constants import CONST_GAME_GAME_RUNNING, CONST_GAME_GAME_MODE_CHOICES, \
-    CONST_GAME_GAME_STATUS_CHOICES, CONST_GAME_GAME_OPTIONS_DEFAULTS, CONST_GAME_EVENT_TYPE_CHOICES, \
-    CONST_GRID_TICKET_CATEGORIES_CHOICES
+    CONST_GAME_GAME_STATUS_CHOICES, CONST_GAME_EVENT_TYPE_CHOICES, \
+    CONST_GRID_TICKET_CATEGORIES_CHOICES, CONST_GAME_SCOREBOARD_CACHE_SIZE, CONST_GAME_SCOREBOARD_CACHE_TIMEOUT, \
+    CONST_GAME_DELTA_TYPE_CHOICES, CONST_GAME_DELTA_SCORE, CONST_GAME_DELTA_HOST, CONST_GAME_DELTA_FLAGS, \
+    CONST_GAME_DELTA_TICKETS, CONST_GAME_DELTA_BEACONS, CONST_GAME_DELTA_EVENTS, CONST_GAME_DELTA_POLL_TIME, \
+    CONST_GAME_DELTA_POLL_WAIT, CONST_GAME_DELTA_POLL_SIZE, CONST_GAME_DELTA_STREAM_TIME, CONST_GAME_DELTA_HEARTBEAT_TIME, \
+    CONST_GAME_SCORE_SOURCE_CHOICES, CONST_GAME_SCORE_SOURCE_FIELDS, CONST_GAME_SCORE_HOST, CONST_GAME_SCORE_BEACON, \
+    CONST_GAME_SCORE_TICKET, CONST_GAME_SCORE_TICKET_CLOSE, CONST_GAME_SCORE_TICKET_REOPEN, CONST_GAME_EVENT_MESSAGE, \
+    CONST_GAME_EVENT_WINDOW, CONST_GAME_EVENT_TWEET_BATCH, CONST_GAME_DELTA_WAIT_MAX
+
+SCOREBOARD_CACHE = CacheTable('Scoreboard', CONST_GAME_SCOREBOARD_CACHE_SIZE, CONST_GAME_SCOREBOARD_CACHE_TIMEOUT)
+DELTA_SLOTS = StreamSlots('Delta', int(getattr(settings, 'SBE_DELTA_WAIT_MAX', CONST_GAME_DELTA_WAIT_MAX)))
+
+
+def count_when(**conditions):
+    return Sum(Case(When(then=1, **conditions), default=0, output_field=IntegerField()))
 
 
 def store_score_history(team, score):
@@ -45,6 +73,17 @@ def game_event_create(game, event_message):
     #event.save()
 
 
+def game_delta_create(game_id, delta_type, delta_data):
+    if game_id is None:
+        raise ValueError('Parameter "game_id" cannot be None!')
+    delta = GameDelta()
+    delta.game_id = game_id
+    delta.type = delta_type
+    delta.data = json.dumps(delta_data)
+    delta.save()
+    del delta
+
+
 # TODO: Expand this class with automated functions
 class GameModel(models.Model):
     class Meta:
@@ -65,9 +104,11 @@ class Job(GameModel):
     class Meta:
         verbose_name = 'Monitor Job'
         verbose_name_plural = 'Monitor Jobs'
+        index_together = (('monitor', 'finish', 'start'), ('finish', 'expires'))
 
     start = models.DateTimeField('Job Start', auto_now_add=True)
     finish = models.DateTimeField('Job Finish', null=True, blank=True)
+    expires = models.DateTimeField('Job Lease Expires', null=True, blank=True, editable=False)
     monitor = models.ForeignKey('scorebot_game.GameMonitor', on_delete=models.CASCADE)
     host = models.ForeignKey('scorebot_grid.Host', on_delete=models.CASCADE, related_name='jobs')
 
@@ -86,8 +127,11 @@ class Job(GameModel):
         self.delete()
 
     def is_expired(self, score_time):
-        expired = self.finish is None and \
-                  self.__len__() > int(self.monitor.game.get_option('job_timeout'))
+        if self.expires is not None:
+            expired = self.finish is None and score_time >= self.expires
+        else:
+            expired = self.finish is None and \
+                      self.__len__() > get_game_options(self.monitor.game_id).job_timeout
                   #(score_time - self.start).seconds > int(self.monitor.game.get_option('job_timeout'))
         if expired:
             api_debug('CLEANUP', 'Job "%d" has expired!' % self.id)
@@ -95,11 +139,37 @@ class Job(GameModel):
 
     def can_cleanup(self, score_time):
         cleanup = self.finish is not None and \
-                  ((score_time - self.finish).seconds -1200) > int(self.monitor.game.get_option('job_cleanup_time'))
+                  ((score_time - self.finish).seconds -1200) > get_game_options(self.monitor.game_id).job_cleanup_time
         if cleanup:
             api_debug('CLEANUP', 'Job "%d" has passed the cleanup time!' % self.id)
         return cleanup
 
+    @staticmethod
+    def expire_leases(job_leases):
+        """
+        Removes the open Jobs in "job_leases", a list of (Job ID, Host ID, Game ID), whose leases have expired.  The
+        Hosts of these Jobs are freed so they can be given out again before the next round, and the dispatch queues
+        of their Games are rebuilt.  Jobs that were finished in the meantime are left alone.
+        """
+        if len(job_leases) == 0:
+            return 0
+        job_ids = [j[0] for j in job_leases]
+        with transaction.atomic():
+            expired_hosts = list(Job.objects.filter(id__in=job_ids, finish__isnull=True)
+                                 .values_list('host_id', flat=True))
+            if len(expired_hosts) == 0:
+                return 0
+            Host.objects.filter(id__in=expired_hosts).exclude(
+                id__in=Job.objects.filter(finish__isnull=True).exclude(id__in=job_ids).values('host_id'))\
+                .update(scored=None)
+            jobs_expired = Job.objects.filter(id__in=job_ids, finish__isnull=True).delete()[1].get(Job._meta.label, 0)
+        for game_id in set(j[2] for j in job_leases):
+            JOB_DISPATCH.invalidate(game_id)
+        api_debug('JOB', 'Expired "%d" Job leases, their Hosts can be given out again.', None, jobs_expired)
+        del job_ids
+        del expired_hosts
+        return jobs_expired
+
 
 # TODO: Work on history on game finish hook
 class Game(GameModel):
@@ -121,53 +191,184 @@ class Game(GameModel):
     mode = models.SmallIntegerField('Game Mode', default=0, choices=CONST_GAME_GAME_MODE_CHOICES)
     options = models.ForeignKey('scorebot_core.Options', null=True, blank=True, on_delete=models.SET_NULL)
     status = models.PositiveSmallIntegerField('Game Status', default=0, choices=CONST_GAME_GAME_STATUS_CHOICES)
+    round = models.PositiveIntegerField('Game Round', default=0, editable=False)
+    version = models.PositiveIntegerField('Game State Version', default=0, editable=False)
 
     def __str__(self):
         return '[Game] %s <%s|%d>' % (self.name, self.get_status_display(), self.teams.all().count())
 
+    def save(self, *args, **kwargs):
+        # The round and version are only changed by "round_score" and "update_version", do not overwrite them with
+        # a stale value.
+        if self.pk is not None and not kwargs.get('force_insert', False) and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in ('round', 'version')]
+        super(Game, self).save(*args, **kwargs)
+        OPTIONS_CACHE.pop(self.id)
+        Game.update_version(self.id)
+
+    @staticmethod
+    def update_version(game_id):
+        if game_id is not None:
+            Game.objects.filter(id=game_id).update(version=models.F('version') + 1)
+
+    @staticmethod
+    def get_scoreboard(game_id):
+        game_version = Game.objects.filter(id=game_id).values_list('version', flat=True).get()
+        scoreboard = SCOREBOARD_CACHE.get(game_id)
+        if scoreboard is not None and scoreboard[0] == game_version:
+            return scoreboard[1], scoreboard[2]
+        scoreboard_json = Game.objects.get(id=game_id).get_json_scoreboard()
+        scoreboard_tag = '"%s"' % hashlib.md5(scoreboard_json.encode('UTF-8')).hexdigest()
+        SCOREBOARD_CACHE.set(game_id, (game_version, scoreboard_tag, scoreboard_json))
+        del game_version
+        return scoreboard_tag, scoreboard_json
+
     def finished(self):
         # TODO: Add hook to delete all Game Models and reset all Grid Models
         pass
 
     def get_json_scoreboard(self):
+        # Each part of the scoreboard is loaded with a single query for the whole Game and split by Team, so the
+        # number of queries does not change with the number of Teams, Hosts or Flags.
+        team_flags = dict()
+        for team_id, flags_open, flags_lost in Flag.objects.filter(team__game=self, enabled=True).values('team_id')\
+                .annotate(open=count_when(captured__isnull=True), lost=count_when(captured__isnull=False))\
+                .values_list('team_id', 'open', 'lost').order_by():
+            team_flags[team_id] = {'open': flags_open, 'lost': flags_lost, 'captured': 0}
+        for team_id, flags_captured in Flag.objects.filter(captured__game=self, enabled=True).values('captured_id')\
+                .annotate(count=Count('id')).values_list('captured_id', 'count').order_by():
+            team_flags.setdefault(team_id, {'open': 0, 'lost': 0, 'captured': 0})['captured'] = flags_captured
+        team_tickets = dict()
+        for team_id, tickets_open, tickets_closed in GameTicket.objects.filter(team__game=self).values('team_id')\
+                .annotate(open=count_when(closed=False), closed=count_when(closed=True))\
+                .values_list('team_id', 'open', 'closed').order_by():
+            team_tickets[team_id] = {'open': tickets_open, 'closed': tickets_closed}
+        team_hosts = dict()
+        for host in Host.objects.filter(team__game=self).prefetch_related('services'):
+            team_hosts.setdefault(host.team_id, list()).append(host.get_json_scoreboard())
+        team_beacons = dict()
+        for team_id, attacker_id, attacker_color in GameCompromiseHost.objects.filter(
+                team__game=self, beacon__finish__isnull=True).values_list('team_id', 'beacon__attacker_id',
+                                                                          'beacon__attacker__color'):
+            team_beacons.setdefault(team_id, list()).append(GameTeam.get_json_beacon(attacker_id, attacker_color))
         game_json = {'name': html.escape(self.name),
                      'message': html.escape('This ProsVJoes CTF!'), #get_scoreboard_message(self.id)),
                      'mode': self.mode,
-                     'teams': [t.get_json_scoreboard() for t in self.teams.all()],
-                     'events': [e.get_json_scoreboard() for e in GameEvent.objects.filter(game=self)],
-                     'credit': Credit.get_next_credit(),
+                     'teams': [t.get_json_scoreboard(team_flags.get(t.id, {'open': 0, 'lost': 0, 'captured': 0}),
+                                                     team_tickets.get(t.id, {'open': 0, 'closed': 0}),
+                                                     team_hosts.get(t.id, []), team_beacons.get(t.id, []))
+                               for t in self.teams.select_related('score')],
+                     'events': [e.get_json_scoreboard() for e in GameEvent.get_active(self.id)],
+                     'credit': Credit.get_next_credit(self.id),
                      }
         game_json_data = json.dumps(game_json)
         del game_json
+        del team_flags
+        del team_hosts
+        del team_tickets
+        del team_beacons
         return game_json_data
 
     def get_option(self, option_name):
-        if self.options is None:
-            try:
-                return CONST_GAME_GAME_OPTIONS_DEFAULTS[option_name]
-            except KeyError:
-                return None
-        try:
-            return getattr(self.options, option_name)
-        except AttributeError:
-            return None
+        return getattr(self.get_options(), option_name, None)
+
+    def get_options(self):
+        return get_game_options(self.id)
+
+    def get_round_uptime(self, round_events):
+        host_scores = dict()
+        for host_id, host_name, team_id, team_name, service_value, content_status in Service.objects.filter(
+                host__team__game=self, host__online=True, status=0).exclude(bonus=True, bonus_started=False)\
+                .values_list('host_id', 'host__name', 'host__team_id', 'host__team__name', 'value', 'content__status'):
+            if content_status is not None:
+                service_value = math.floor(service_value * (content_status / 100))
+            if host_id not in host_scores:
+                host_scores[host_id] = ['%s\\%s\\%s' % (self.name, team_name, host_name), team_id, 0]
+            host_scores[host_id][2] += service_value
+        for host_id, host_score in host_scores.items():
+            api_score(host_id, 'HOST', host_score[0], host_score[2])
+            round_events.append(GameScoreEvent(team_id=host_score[1], source=CONST_GAME_SCORE_HOST, object=host_id,
+                                               value=host_score[2], round=self.round))
+        del host_scores
+
+    def get_round_beacons(self, round_events):
+        beacon_value = -1 * self.get_options().beacon_value
+        for beacon_id, team_id, team_name, attacker_name in GameCompromiseHost.objects.filter(
+                team__game=self, beacon__finish__isnull=True).values_list('beacon_id', 'team_id', 'team__name',
+                                                                          'beacon__attacker__name'):
+            api_score(beacon_id, 'BEACON', '%s\\%s' % (self.name, team_name), beacon_value,
+                      '%s\\%s' % (self.name, attacker_name))
+            round_events.append(GameScoreEvent(team_id=team_id, source=CONST_GAME_SCORE_BEACON, object=beacon_id,
+                                               value=beacon_value, round=self.round))
+        del beacon_value
+
+    def get_round_tickets(self, round_events, score_time):
+        ticket_list = list()
+        game_options = self.get_options()
+        ticket_cost = game_options.ticket_cost
+        ticket_grace = game_options.ticket_grace_period
+        ticket_scoring = game_options.ticket_max_scoring
+        for ticket_id, ticket_name, ticket_started, team_id, team_name in GameTicket.objects.filter(
+                team__game=self, closed=False, total__lt=game_options.ticket_max_score)\
+                .values_list('id', 'name', 'started', 'team_id', 'team__name'):
+            open_time = (score_time - ticket_started).seconds
+            if ticket_grace < open_time < ticket_scoring:
+                api_score(ticket_id, 'TICKET', '%s\\%s' % (self.name, team_name), -1 * ticket_cost)
+                api_info('SCORING', 'Team "%s\\%s" lost "%d" points to open Ticket "%s"!'
+                         % (self.name, team_name, ticket_cost, ticket_name))
+                round_events.append(GameScoreEvent(team_id=team_id, source=CONST_GAME_SCORE_TICKET, object=ticket_id,
+                                                   value=-1 * ticket_cost, round=self.round))
+                ticket_list.append(ticket_id)
+            del open_time
+        if len(ticket_list) > 0:
+            GameTicket.objects.filter(id__in=ticket_list).update(total=models.F('total') + ticket_cost)
+        del ticket_list
+        del ticket_cost
+        del ticket_grace
+        del ticket_scoring
+        del game_options
 
     def round_score(self, score_time):
         api_debug('SCORING', 'Checking if Game "%s" can be scored..' % self.name)
-        if self.scored is None or (score_time - self.scored).seconds > int(self.get_option('round_time')):
+        if self.scored is None or (score_time - self.scored).seconds > self.get_options().round_time:
             api_info('SCORING', 'Starting round scoring on Game "%s"..' % self.name)
-            for team in self.teams.all():
-                api_debug('SCORING', 'Scoring Team "%s" assets..' % team.get_canonical_name())
-                for host in team.hosts.all():
-                    host.round_score()
-                for flag in team.flags.filter(enabled=True):
-                    flag.round_score()
-                for beacon in team.compromises.filter(beacon__finish__isnull=True):
-                    beacon.beacon.round_score()
-                for ticket in team.tickets.all():
-                    ticket.round_score(score_time)
-            self.scored = score_time
-            self.save()
+            teams = list(self.teams.select_related('score'))
+            round_events = list()
+            with transaction.atomic():
+                Game.objects.filter(id=self.id).update(round=models.F('round') + 1)
+                self.round = Game.objects.filter(id=self.id).values_list('round', flat=True).get()
+                self.get_round_uptime(round_events)
+                self.get_round_beacons(round_events)
+                self.get_round_tickets(round_events, score_time)
+                GameScoreEvent.objects.bulk_create(round_events)
+                round_scores = {team.id: {'uptime': 0, 'beacons': 0, 'tickets': 0} for team in teams}
+                for event in round_events:
+                    round_scores[event.team_id][CONST_GAME_SCORE_SOURCE_FIELDS[event.source]] += event.value
+                for team in teams:
+                    Score.objects.filter(id=team.score_id).update(
+                        date=score_time, **{f: models.F(f) + v for f, v in round_scores[team.id].items()})
+                scores = Score.objects.in_bulk([team.score_id for team in teams])
+                history = list()
+                deltas = list()
+                for team in teams:
+                    team.score = scores[team.score_id]
+                    history.append(GameScore(team=team, flags=team.score.flags, uptime=team.score.uptime,
+                                             tickets=team.score.tickets, beacons=team.score.beacons))
+                    deltas.append(GameDelta(game=self, type=CONST_GAME_DELTA_SCORE,
+                                            data=json.dumps({'team': team.id, 'score': team.get_json_score()})))
+                GameScore.objects.bulk_create(history)
+                GameDelta.objects.bulk_create(deltas)
+                Host.objects.filter(team__game=self, scored__isnull=False).update(scored=None)
+                self.scored = score_time
+                self.save()
+                del scores
+                del deltas
+                del history
+            JOB_DISPATCH.invalidate(self.id)
+            del teams
+            del round_scores
+            del round_events
             api_debug('SCORING', 'Scoring round on Game "%s" complete!' % self.name)
 
     def reporter_check(self, check_time):
@@ -210,11 +411,13 @@ class GameTeam(GameModel):
         self.delete()
 
     def get_beacons(self):
-        beacons = []
-        for beacon in self.compromises.filter(beacon__finish__isnull=True):
-            beacons.append({'team': beacon.beacon.attacker.id,
-                            'color': '#%s' % hex(beacon.beacon.attacker.color).replace('0x', '').zfill(6)})
-        return beacons
+        return [GameTeam.get_json_beacon(attacker_id, attacker_color) for attacker_id, attacker_color in
+                self.compromises.filter(beacon__finish__isnull=True).values_list('beacon__attacker_id',
+                                                                                 'beacon__attacker__color')]
+
+    @staticmethod
+    def get_json_beacon(attacker_id, attacker_color):
+        return {'team': attacker_id, 'color': '#%s' % hex(attacker_color).replace('0x', '').zfill(6)}
 
     def __lt__(self, other):
         return isinstance(other, Team) and other.score > self.score
@@ -233,30 +436,32 @@ class GameTeam(GameModel):
             return '%s\\%s' % (self.game.name, self.name)
         return self.name
 
-    def get_json_scoreboard(self):
+    def get_json_score(self):
+        return {'total': self.score.get_score(), 'health': self.score.uptime, 'beacons': self.score.beacons,
+                'tickets': self.score.tickets, 'flags': self.score.flags}
+
+    def get_json_flags(self):
+        flags = self.flags.filter(enabled=True).aggregate(open=count_when(captured__isnull=True),
+                                                          lost=count_when(captured__isnull=False))
+        return {'open': flags['open'] or 0, 'lost': flags['lost'] or 0,
+                'captured': self.attacker_flags.filter(enabled=True).count()}
+
+    def get_json_tickets(self):
+        tickets = self.tickets.aggregate(open=count_when(closed=False), closed=count_when(closed=True))
+        return {'open': tickets['open'] or 0, 'closed': tickets['closed'] or 0}
+
+    def get_json_scoreboard(self, flags=None, tickets=None, hosts=None, beacons=None):
         team_json = {'id': self.id,
                      'name': html.escape(self.name),
                      'color': '#%s' % str(hex(self.color)).replace('0x', '').zfill(6),
-                     'score': {
-                         'total': self.score.get_score(),
-                         'health': self.score.uptime,
-                         'beacons': self.score.beacons,
-                         'tickets': self.score.tickets,
-                         'flags': self.score.flags,
-                         },
+                     'score': self.get_json_score(),
                      'offense': self.offensive,
-                     'flags': {
-                         'open': self.flags.filter(enabled=True, captured__isnull=True).count(),
-                         'lost': self.flags.filter(enabled=True, captured__isnull=False).count(),
-                         'captured': self.attacker_flags.filter(enabled=True).count()
-                         },
-                     'tickets': {
-                         'open': self.tickets.filter(closed=False).count(),
-                         'closed': self.tickets.filter(closed=True).count()
-                         },
-                     'hosts': [h.get_json_scoreboard() for h in self.hosts.all()],
+                     'flags': (flags if flags is not None else self.get_json_flags()),
+                     'tickets': (tickets if tickets is not None else self.get_json_tickets()),
+                     'hosts': (hosts if hosts is not None else [h.get_json_scoreboard() for h in
+                                                                 self.hosts.prefetch_related('services')]),
                      'logo': (self.logo.url if self.logo.__bool__() else 'default.png'),
-                     'beacons': self.get_beacons(), 'minimal': self.minimal}
+                     'beacons': (beacons if beacons is not None else self.get_beacons()), 'minimal': self.minimal}
         return team_json
 
     def save(self, *args, **kwargs):
@@ -269,22 +474,39 @@ class GameTeam(GameModel):
         if self.token is None:
             self.token = token_create_new(90)
         super(GameTeam, self).save(*args, **kwargs)
+        SUBNET_INDEX.invalidate(self.game_id)
+        Host.jobs_changed()
 
-    def set_flags(self, flags_score):
-        self.score.set_flags(flags_score)
-        store_score_history(self, self.score)
-
-    def set_uptime(self, uptime_score):
-        self.score.set_uptime(uptime_score)
-        store_score_history(self, self.score)
+    def delete(self, *args, **kwargs):
+        SUBNET_INDEX.invalidate(self.game_id)
+        Host.jobs_changed()
+        return super(GameTeam, self).delete(*args, **kwargs)
 
-    def set_tickets(self, tickets_score):
-        self.score.set_tickets(tickets_score)
-        store_score_history(self, self.score)
-
-    def set_beacons(self, beacons_score):
-        self.score.set_beacons(beacons_score)
+    def score_changed(self):
         store_score_history(self, self.score)
+        Game.update_version(self.game_id)
+        game_delta_create(self.game_id, CONST_GAME_DELTA_SCORE, {'team': self.id, 'score': self.get_json_score()})
+
+    def flags_changed(self):
+        game_delta_create(self.game_id, CONST_GAME_DELTA_FLAGS, {'team': self.id, 'flags': self.get_json_flags()})
+
+    def beacons_changed(self):
+        game_delta_create(self.game_id, CONST_GAME_DELTA_BEACONS, {'team': self.id, 'beacons': self.get_beacons()})
+
+    def set_score(self, score_source, score_value, score_object=None):
+        score_value = int(score_value)
+        with transaction.atomic():
+            score_event = GameScoreEvent()
+            score_event.team = self
+            score_event.value = score_value
+            score_event.source = score_source
+            score_event.object = score_object
+            # The Game is already loaded by the scoring paths, the round only moves once per round time.
+            score_event.round = self.game.round
+            score_event.save()
+            self.score.set_score(CONST_GAME_SCORE_SOURCE_FIELDS[score_source], score_value)
+            del score_event
+        self.score_changed()
 
 
 class GamePort(GameModel):
@@ -377,10 +599,54 @@ class GameScore(GameModel):
         return isinstance(other, GameScore) and len(other) == self.__len__()
 
 
+class GameScoreEvent(GameModel):
+    """
+    Scorebot v3: GameScoreEvent
+
+    Append only ledger of every change made to a Team's score.  The Score attached to the GameTeam is the running
+    total of this ledger and is updated in the same transaction.  The totals at any point in time can be rebuilt from
+    the ledger with "get_score".
+    """
+
+    class Meta:
+        verbose_name = '[Game] Score Event'
+        verbose_name_plural = '[Game] Score Events'
+        index_together = (('team', 'date'),)
+
+    value = models.IntegerField('Score Value')
+    round = models.PositiveIntegerField('Game Round', default=0)
+    date = models.DateTimeField('Score Time', auto_now_add=True)
+    object = models.PositiveIntegerField('Score Object ID', null=True, blank=True)
+    source = models.PositiveSmallIntegerField('Score Source', choices=CONST_GAME_SCORE_SOURCE_CHOICES)
+    team = models.ForeignKey('scorebot_game.GameTeam', on_delete=models.CASCADE, related_name='score_events')
+
+    def __str__(self):
+        return '[GameScoreEvent] <%s> %s %d (Round %d)' % (self.team.get_canonical_name(), self.get_source_display(),
+                                                          self.value, self.round)
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Score Events cannot be changed once created!')
+        super(GameScoreEvent, self).save(*args, **kwargs)
+
+    @staticmethod
+    def get_score(team_id, score_time=None):
+        score = {'flags': 0, 'uptime': 0, 'tickets': 0, 'beacons': 0}
+        score_events = GameScoreEvent.objects.filter(team_id=team_id)
+        if score_time is not None:
+            score_events = score_events.filter(date__lte=score_time)
+        for score_source, score_value in score_events.values('source').annotate(total=Sum('value'))\
+                .values_list('source', 'total').order_by():
+            score[CONST_GAME_SCORE_SOURCE_FIELDS[score_source]] += score_value
+        del score_events
+        return score
+
+
 class GameEvent(GameModel):
     class Meta:
         verbose_name = '[Game] Event'
         verbose_name_plural = '[Game] Events'
+        index_together = (('game', 'type', 'timeout'),)
 
     timeout = models.DateTimeField('Event Timeout')
     data = models.TextField('Event Data', null=True, blank=True)
@@ -390,6 +656,37 @@ class GameEvent(GameModel):
     def __str__(self):
         return '[GameEvent] %s' % self.game.name
 
+    def save(self, *args, **kwargs):
+        super(GameEvent, self).save(*args, **kwargs)
+        Game.update_version(self.game_id)
+        GameEvent.events_changed(self.game_id)
+
+    def delete(self, *args, **kwargs):
+        Game.update_version(self.game_id)
+        event_result = super(GameEvent, self).delete(*args, **kwargs)
+        GameEvent.events_changed(self.game_id)
+        return event_result
+
+    @staticmethod
+    def events_changed(game_id):
+        game_delta_create(game_id, CONST_GAME_DELTA_EVENTS,
+                          {'events': [e.get_json_scoreboard() for e in GameEvent.get_active(game_id)]})
+
+    @staticmethod
+    def get_active(game_id, event_type=None):
+        events = GameEvent.objects.filter(game_id=game_id, timeout__gt=timezone.now())
+        if event_type is not None:
+            events = events.filter(type=event_type)
+        return events.order_by('id')
+
+    @staticmethod
+    def get_window(game_id):
+        return GameEvent.get_active(game_id, CONST_GAME_EVENT_WINDOW).values_list('data', flat=True).first()
+
+    @staticmethod
+    def get_tweets(game_id, limit=CONST_GAME_EVENT_TWEET_BATCH):
+        return list(GameEvent.get_active(game_id, CONST_GAME_EVENT_MESSAGE).values_list('id', 'data')[:limit])
+
     def get_json_scoreboard(self):
         try:
             event_data = json.loads(self.data)
@@ -398,7 +695,104 @@ class GameEvent(GameModel):
         return {'type': self.type, 'data': event_data}
 
     def is_expired(self, expire_time):
-        return (self.timeout - expire_time).seconds <= 0
+        return self.timeout <= expire_time
+
+
+class GameDelta(GameModel):
+    """
+    Scorebot v3: GameDelta
+
+    Journal of changes made to the Game scoreboard by the scoring code.  Each entry carries the new state of the
+    changed part (Team score, Host status, flag/ticket counts, beacons or events) so entries can be applied more than
+    once by the clients.  The entry ID is the stream position used by the scoreboard stream and long-poll API calls.
+    """
+
+    class Meta:
+        verbose_name = '[Game] Scoreboard Delta'
+        verbose_name_plural = '[Game] Scoreboard Deltas'
+
+    data = models.TextField('Delta Data')
+    date = models.DateTimeField('Delta Time', auto_now_add=True)
+    game = models.ForeignKey('scorebot_game.Game', on_delete=models.CASCADE, related_name='deltas')
+    type = models.PositiveSmallIntegerField('Delta Type', choices=CONST_GAME_DELTA_TYPE_CHOICES, default=0)
+
+    def __str__(self):
+        return '[GameDelta] %d <%s> %s' % (self.id, self.get_type_display(), self.game.name)
+
+    @staticmethod
+    def get_last():
+        delta_last = GameDelta.objects.order_by('-id').values_list('id', flat=True).first()
+        return delta_last if delta_last is not None else 0
+
+    @staticmethod
+    def is_stale(delta_last):
+        # Entries are removed oldest first, if the entry after "delta_last" is gone the client missed changes.
+        delta_first = GameDelta.objects.order_by('id').values_list('id', flat=True).first()
+        return delta_first is not None and delta_last < delta_first - 1
+
+    @staticmethod
+    def get_deltas(game_id, delta_last):
+        return list(GameDelta.objects.filter(game_id=game_id, id__gt=delta_last).order_by('id')
+                    .values_list('id', 'type', 'data')[:CONST_GAME_DELTA_POLL_SIZE])
+
+    @staticmethod
+    def get_json_delta(delta_type, delta_data):
+        return '{"type": "%s", "data": %s}' % (dict(CONST_GAME_DELTA_TYPE_CHOICES)[delta_type], delta_data)
+
+    @staticmethod
+    def get_poll(game_id, delta_last=None):
+        if delta_last is None or delta_last < 0 or GameDelta.is_stale(delta_last):
+            delta_last = GameDelta.get_last()
+            return '{"last": %d, "snapshot": %s, "deltas": []}' % (delta_last, Game.get_scoreboard(game_id)[1])
+        poll_retry = 0
+        deltas = GameDelta.get_deltas(game_id, delta_last)
+        if len(deltas) == 0 and not DELTA_SLOTS.acquire():
+            # Only a limited number of polls per process wait for new deltas, the rest answer right away (with the
+            # time to wait before polling again) so they do not take every worker away from the other API calls.
+            poll_retry = CONST_GAME_DELTA_POLL_WAIT
+        elif len(deltas) == 0:
+            try:
+                poll_end = time.monotonic() + CONST_GAME_DELTA_POLL_WAIT
+                while len(deltas) == 0 and time.monotonic() < poll_end:
+                    time.sleep(CONST_GAME_DELTA_POLL_TIME)
+                    deltas = GameDelta.get_deltas(game_id, delta_last)
+                del poll_end
+            finally:
+                DELTA_SLOTS.release()
+        if len(deltas) > 0:
+            delta_last = deltas[-1][0]
+        return '{"last": %d, "retry": %d, "deltas": [%s]}' % (
+            delta_last, poll_retry, ', '.join([GameDelta.get_json_delta(d[1], d[2]) for d in deltas]))
+
+    @staticmethod
+    def open_stream(game_id, delta_last=None):
+        if not DELTA_SLOTS.acquire():
+            return None
+        return SlotStream(GameDelta.get_stream(game_id, delta_last), DELTA_SLOTS)
+
+    @staticmethod
+    def get_stream(game_id, delta_last=None):
+        stream_end = time.monotonic() + CONST_GAME_DELTA_STREAM_TIME
+        yield 'retry: %d\n\n' % (CONST_GAME_DELTA_POLL_TIME * 1000)
+        if delta_last is None or delta_last < 0 or GameDelta.is_stale(delta_last):
+            delta_last = GameDelta.get_last()
+            yield 'id: %d\nevent: snapshot\ndata: %s\n\n' % (delta_last, Game.get_scoreboard(game_id)[1])
+        stream_beat = time.monotonic()
+        while time.monotonic() < stream_end:
+            deltas = GameDelta.get_deltas(game_id, delta_last)
+            if len(deltas) > 0:
+                for delta in deltas:
+                    yield 'id: %d\nevent: delta\ndata: %s\n\n' % (delta[0], GameDelta.get_json_delta(delta[1],
+                                                                                                       delta[2]))
+                delta_last = deltas[-1][0]
+                stream_beat = time.monotonic()
+            elif (time.monotonic() - stream_beat) > CONST_GAME_DELTA_HEARTBEAT_TIME:
+                yield ': heartbeat\n\n'
+                stream_beat = time.monotonic()
+            del deltas
+            time.sleep(CONST_GAME_DELTA_POLL_TIME)
+        del stream_end
+        del stream_beat
 
 
 class GameTicket(GameModel):
@@ -424,12 +818,12 @@ class GameTicket(GameModel):
             return
         self.closed = True
         if self.type == 1:
-            self.team.set_tickets(self.total)
+            self.team.set_score(CONST_GAME_SCORE_TICKET_CLOSE, self.total, self.id)
             api_debug('SCORING-ASYNC', 'Giving Team "%s" back "%d" points for closing a Ticket "%s"!'
                       % (self.team.get_canonical_name(), self.total, self.name))
             api_score(self.id, 'TICKET-CLOSE', self.team.get_canonical_name(), self.total)
         else:
-            self.team.set_tickets(self.total/2)
+            self.team.set_score(CONST_GAME_SCORE_TICKET_CLOSE, self.total/2, self.id)
             api_debug('SCORING-ASYNC', 'Giving Team "%s" back "%d" points for closing a Ticket "%s"!'
                      % (self.team.get_canonical_name(), self.total/2, self.name))
             api_score(self.id, 'TICKET-CLOSE', self.team.get_canonical_name(), self.total/2)
@@ -437,43 +831,60 @@ class GameTicket(GameModel):
                  % (self.team.get_canonical_name(), self.name, self.get_type_display()))
         api_event(self.team.game, 'Team %s just closed a Ticket "%s"!' % (self.team.name, self.name))
         self.save()
+        self.tickets_changed()
 
     def reopen_ticket(self):
         if not self.closed:
             return
         self.closed = False
-        reopen_cost = float(float(self.team.game.get_option('ticket_reopen_multiplier'))/100)
+        reopen_cost = float(get_game_options(self.team.game_id).ticket_reopen_multiplier)/100
         score_value = -1 * (reopen_cost * self.total)
-        self.team.set_tickets(score_value)
+        self.team.set_score(CONST_GAME_SCORE_TICKET_REOPEN, score_value, self.id)
         api_score(self.id, 'TICKET-REOPEN', self.team.get_canonical_name(), score_value)
         api_info('SCORING-ASYNC', 'Team "%s" had the Ticket "%s" reopened, negating "%d" points!'
                  % (self.team.get_canonical_name(), self.name, score_value))
         del score_value
         api_event(self.team.game, 'Ticket "%s" for %s was reopened!' % (self.name, self.team.name))
         self.save()
+        self.tickets_changed()
 
     def get_canonical_name(self):
         if self.team is not None:
             return '%s\\%s' % (self.team.get_canonical_name(), self.name)
         return self.name
 
+    def save(self, *args, **kwargs):
+        ticket_new = self.pk is None
+        super(GameTicket, self).save(*args, **kwargs)
+        if self.team is not None:
+            Game.update_version(self.team.game_id)
+            if ticket_new:
+                self.tickets_changed()
+        del ticket_new
+
+    def tickets_changed(self):
+        game_delta_create(self.team.game_id, CONST_GAME_DELTA_TICKETS,
+                          {'team': self.team.id, 'tickets': self.team.get_json_tickets()})
+
     def can_score(self, score_time):
         if self.closed:
             return False
+        game_options = get_game_options(self.team.game_id)
         open_time = (score_time - self.started).seconds
-        if open_time >= int(self.team.game.get_option('ticket_max_scoring')):
+        if open_time >= game_options.ticket_max_scoring:
             return False
-        if open_time > int(self.team.game.get_option('ticket_grace_period')):
+        if open_time > game_options.ticket_grace_period:
             return True
         return False
 
     def round_score(self, score_time):
         if self.can_score(score_time):
             api_debug('SCORING', 'Scoring Tickect "%s"..' % self.get_canonical_name())
-            if self.total < int(self.team.game.get_option('ticket_max_score')):
-                ticket_score = int(self.team.game.get_option('ticket_cost'))
+            game_options = get_game_options(self.team.game_id)
+            if self.total < game_options.ticket_max_score:
+                ticket_score = game_options.ticket_cost
                 self.total = self.total + ticket_score
-                self.team.set_tickets(-1 * ticket_score)
+                self.team.set_score(CONST_GAME_SCORE_TICKET, -1 * ticket_score, self.id)
                 api_score(self.id, 'TICKET', self.team.get_canonical_name(), -1 * ticket_score)
                 api_info('SCORING', 'Team "%s" lost "%d" points to open Ticket "%s"!'
                           % (self.team.get_canonical_name(), ticket_score, self.name))
@@ -558,85 +969,166 @@ class GameMonitor(GameModel):
     def __str__(self):
         return '%s <%s:%d>' % (self.monitor.__str__(), ('I' if self.only else 'E'), self.selected_hosts.all().count())
 
+    def save(self, *args, **kwargs):
+        super(GameMonitor, self).save(*args, **kwargs)
+        JOB_DISPATCH.invalidate(self.game_id)
+
+    def get_dispatch_hosts(self):
+        hosts = Host.objects.filter(team__game=self.game, scored__isnull=True).exclude(
+            id__in=Job.objects.filter(finish__isnull=True).values('host_id'))
+        host_rules = list(self.selected_hosts.all().values_list('id', flat=True))
+        if len(host_rules) > 0:
+            api_debug('JOB', 'Monitor "%s" has host selection rules in place. Type %s', None, self.monitor.name,
+                      ('Include' if self.only else 'Exclude'))
+            if self.only:
+                hosts = hosts.filter(id__in=host_rules)
+            else:
+                hosts = hosts.exclude(id__in=host_rules)
+        del host_rules
+        return list(hosts.values_list('id', flat=True))
+
+    def lease_job(self, host_id, lease_time, lease_expires=None):
+        if Host.objects.filter(id=host_id, scored__isnull=True).update(scored=lease_time) == 0:
+            return None
+        job = Job()
+        job.monitor = self
+        job.host_id = host_id
+        job.expires = (lease_expires if lease_expires is not None else
+                       lease_time + timedelta(seconds=get_game_options(self.game_id).job_timeout + 1200))
+        job.save()
+        return job
+
+    def create_jobs(self, job_count):
+        Job.expire_leases(JOB_LEASES.expire())
+        if self.game.status != CONST_GAME_GAME_RUNNING:
+            return []
+        jobs = dict()
+        lease_time = timezone.now()
+        lease_expires = lease_time + timedelta(seconds=get_game_options(self.game_id).job_timeout + 1200)
+        with transaction.atomic():
+            while len(jobs) < job_count:
+                host_id = JOB_DISPATCH.next_host(self)
+                if host_id is None:
+                    break
+                job = self.lease_job(host_id, lease_time, lease_expires)
+                if job is None:
+                    api_debug('JOB', 'Host "%d" was already leased, moving on.', None, host_id)
+                    continue
+                jobs[host_id] = job
+        for host_id, job in jobs.items():
+            JOB_LEASES.add(job.id, lease_expires.timestamp(), (job.id, host_id, self.game_id))
+        del lease_time
+        del lease_expires
+        if len(jobs) == 0:
+            api_debug('JOB', 'Monitor "%s" could not select any hosts, telling Monitor to wait.', None, self.monitor.name)
+            return []
+        for host_id, job in jobs.items():
+            api_info('JOB', 'Gave Monitor "%s" Job "%d" for Host "%d".', None, self.monitor.name, job.id, host_id)
+        job_list = Host.get_json_jobs({host_id: job.id for host_id, job in jobs.items()})
+        del jobs
+        return job_list
+
     def create_job(self):
-        if self.game.status == CONST_GAME_GAME_RUNNING:
-            teams = self.game.teams.all()
-            teams_max = len(teams)
-            for team_round in range(0, teams_max):
-                team = random.choice(teams)
-                api_debug('JOB', 'Monitor "%s" selected team "%s"!' % (self.monitor.name, team.name))
-                hosts = team.hosts.filter(scored__isnull=True)
-                api_debug('JOB', 'Team "%s" has "%d" hosts to pick from!' % (team.name, len(hosts)))
-                for host_round in range(0, len(hosts)):
-                    api_debug('JOB', 'Monitor "%s" start host selection round %d.' % (self.monitor.name, host_round))
-                    host = random.choice(hosts)
-                    api_debug('JOB', 'Monitor "%s" attempting to select host "%s".' % (self.monitor.name, host.fqdn))
-                    if host.jobs.filter(finish__isnull=True).count() > 0:
-                        api_debug('JOB', 'Host "%s" has currently open Jobs, moving on.' % host.fqdn)
-                        del host
-                        continue
-                    if self.selected_hosts.all().count() > 0:
-                        api_debug('JOB', 'Monitor "%s" has host selection rules in place. Type %s' %
-                                     (self.monitor.name, ('Include' if self.only else 'Exclude')))
-                        host_rules = self.selected_hosts.filter(id=host.id).count()
-                        if host_rules == 0 and self.only:
-                            api_debug('JOB', 'Monitor "%s" host selection rules denied host "%s".' %
-                                      (self.monitor.name, host.fqdn))
-                            del host
-                            del host_rules
-                            continue
-                        if host_rules != 0 and not self.only:
-                            api_debug('JOB', 'Monitor "%s" host selection rules denied host "%s".' %
-                                      (self.monitor.name, host.fqdn))
-                            del host
-                            del host_rules
-                            continue
-                        del host_rules
-                    api_debug('JOB', 'Monitor "%s" selected host "%s".' % (self.monitor.name, host.fqdn))
-                    job = Job()
-                    job.monitor = self
-                    job.host = host
-                    job.host.scored = timezone.now()
-                    job.host.save()
-                    job.save()
-                    api_info('JOB', 'Gave Monitor "%s" Job "%d" for Host "%s".'
-                             % (self.monitor.name, job.id, host.fqdn))
-                    del team
-                    del hosts
-                    del teams
-                    del teams_max
-                    job_json = host.get_json_job()
-                    del host
-                    job_json['id'] = job.id
-                    del job
-                    job_json_raw = json.dumps(job_json)
-                    del job_json
-                    return job_json_raw
-                del team
-                del hosts
-            del teams
-            del teams_max
-            api_debug('JOB', 'Monitor "%s" could not select any hosts, telling Monitor to wait.' % self.monitor.name)
-        return None
+        job_list = self.create_jobs(1)
+        if len(job_list) == 0:
+            return None
+        return job_list[0]
 
-    def score_job(self, monitor, job, job_data):
+    def score_job(self, monitor, job, job_data, bulk=None, finish_time=None, changed_hosts=None):
         if self.monitor.id != monitor.id:
             api_error('JOB', 'Monitor "%s" returned a Job created by Monitor "%s"!' % (monitor.name, job.monitor.name))
             return False, 'Job was submitted by a different monitor!'
-        api_info('JOB', 'Processing Job "%d" send by Monitor "%s".' % (job.id, monitor.name))
+        api_info('JOB', 'Processing Job "%d" send by Monitor "%s".', None, job.id, monitor.name)
         if self.game.status != CONST_GAME_GAME_RUNNING:
             api_error('JOB', 'Job Game "%s" submitted by Monitor "%s" is not Running!' % (self.game, job.monitor.name))
             return False, 'Game is not running!'
+        job_bulk = BulkUpdate()
         try:
-            job.host.score_job(job, job_data['host'])
-        except KeyError:
+            host_changed = job.host.score_job(job, job_data['host'], job_bulk)
+        except (KeyError, TypeError, ValueError, AttributeError):
             api_error('JOB', 'Job submitted by Monitor "%s" is not in a correct JSON format!' % self.monitor.name)
+            del job_bulk
             return False, 'Not in a valid JSON format!'
-        api_debug('JOB', 'Job "%d" processing finished!' % job.id)
-        job.finish = timezone.now()
-        job.save()
+        api_debug('JOB', 'Job "%d" processing finished!', None, job.id)
+        job.finish = (finish_time if finish_time is not None else timezone.now())
+        job_bulk.add(job, ['finish'])
+        if bulk is None:
+            job_bulk.save()
+            if host_changed:
+                Game.update_version(self.game_id)
+                game_delta_create(self.game_id, CONST_GAME_DELTA_HOST,
+                                  {'team': job.host.team_id, 'host': job.host.get_json_scoreboard()})
+        else:
+            bulk.extend(job_bulk)
+            if host_changed and changed_hosts is not None:
+                changed_hosts.append(job.host)
+        transaction.on_commit(partial(JOB_LEASES.remove, job.id))
+        del job_bulk
+        del host_changed
         return True, None
 
+    @staticmethod
+    def score_jobs(monitor, job_list):
+        job_results = list()
+        job_ids = dict()
+        for job_data in job_list:
+            if not isinstance(job_data, dict) or not isinstance(job_data.get('host', None), dict):
+                job_results.append({'id': None, 'status': 'error', 'message': 'Not in a valid JSON format!'})
+                continue
+            try:
+                job_id = int(job_data['id'])
+            except (KeyError, TypeError, ValueError):
+                job_results.append({'id': None, 'status': 'error', 'message': 'Invalid Job ID!'})
+                continue
+            job_results.append({'id': job_id, 'status': None, 'message': None})
+            job_ids[job_id] = job_data
+        jobs = Job.objects.filter(id__in=job_ids.keys()).select_related('monitor__game', 'monitor__monitor')\
+            .prefetch_related('host__team__game__options', 'host__services__content')
+        jobs = {job.id: job for job in jobs}
+        bulk = BulkUpdate()
+        job_games = set()
+        job_hosts = list()
+        finish_time = timezone.now()
+        with transaction.atomic():
+            for job_result in job_results:
+                if job_result['status'] is not None:
+                    continue
+                job = jobs.get(job_result['id'], None)
+                if job is None:
+                    api_error('JOB', 'Monitor "%s" returned a Job with an non-existent ID "%d"!'
+                              % (monitor.name, job_result['id']))
+                    job_result['status'] = 'error'
+                    job_result['message'] = 'Job with ID "%d" does not exist!' % job_result['id']
+                    continue
+                if job.finish is not None:
+                    api_warning('JOB', 'Monitor "%s" returned a completed Job "%d"!' % (monitor.name, job.id))
+                    job_result['status'] = 'error'
+                    job_result['message'] = 'Job already completed!'
+                    continue
+                status, message = job.monitor.score_job(monitor, job, job_ids[job.id], bulk, finish_time,
+                                                        job_hosts)
+                job_result['status'] = ('accepted' if status else 'error')
+                job_result['message'] = message
+                if status:
+                    job_games.add(job.monitor.game_id)
+                del job
+            api_debug('JOB', 'Saving "%d" changes from "%d" Jobs submitted by Monitor "%s".', None, len(bulk),
+                      len(jobs), monitor.name)
+            bulk.save()
+            for game_id in job_games:
+                Game.update_version(game_id)
+            GameDelta.objects.bulk_create([GameDelta(game_id=h.team.game_id, type=CONST_GAME_DELTA_HOST,
+                                                     data=json.dumps({'team': h.team_id,
+                                                                      'host': h.get_json_scoreboard()}))
+                                           for h in job_hosts])
+        del bulk
+        del job_hosts
+        del jobs
+        del job_games
+        del job_ids
+        del finish_time
+        return job_results
+
 
 class GameCompromise(GameModel):
     """
@@ -650,6 +1142,7 @@ class GameCompromise(GameModel):
     class Meta:
         verbose_name = 'Beacon'
         verbose_name_plural = 'Beacons'
+        index_together = (('attacker', 'finish', 'start'),)
 
     finish = models.DateTimeField('Beacon Completed', null=True, blank=True)
     start = models.DateTimeField('Beacon Start', auto_now_add=True, editable=False)
@@ -673,17 +1166,17 @@ class GameCompromise(GameModel):
         if self.__bool__():
             api_debug('SCORING', 'Beacon "%d" by "%s" is still on Host "%s"!'
                       % (self.id, self.attacker.get_canonical_name(), self.host.get_fqdn()))
-            beacon_value = -1 * int(self.host.team.game.get_option('beacon_value'))
+            beacon_value = -1 * get_game_options(self.host.team.game_id).beacon_value
             api_score(self.id, 'BEACON', self.host.team.get_canonical_name(), beacon_value,
                       self.attacker.get_canonical_name())
-            self.host.team.set_beacons(beacon_value)
+            self.host.team.set_score(CONST_GAME_SCORE_BEACON, beacon_value, self.id)
             del beacon_value
 
     def is_expired(self, now):
-        return self.__len__() > int(self.host.team.game.get_option('beacon_time'))
-#        if self.checkin is None:
-#            return (now - self.start).seconds > int(self.host.team.game.get_option('beacon_time'))
-#        return (now - self.checkin).seconds > int(self.host.team.game.get_option('beacon_time'))
+        beacon_time = get_game_options(self.host.team.game_id).beacon_time
+        if self.checkin is not None and (timezone.now() - self.checkin).total_seconds() <= beacon_time:
+            return False
+        return self.__len__() > beacon_time
 
 
 class GameCompromiseHost(GameModel):
@@ -707,3 +1200,22 @@ class GameCompromiseHost(GameModel):
         return self.host.fqdn if self.host is not None else self.ip
 
 
+# The selected Hosts are changed through the ManyToMany manager (or the admin) without "GameMonitor.save" being
+# called, so the dispatch table must be dropped here as well.  Changes made from the Host side do not carry the Game,
+# every Game's dispatch table is dropped in that case.
+@receiver(m2m_changed, sender=GameMonitor.selected_hosts.through)
+def signal_monitor_hosts_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        JOB_DISPATCH.invalidate()
+    else:
+        JOB_DISPATCH.invalidate(instance.game_id)
+
+
+# The Team DNS servers are part of every Host job template of the Team and are changed through the ManyToMany manager
+# without the Team or DNS being saved, so the job templates must be dropped here.
+@receiver(m2m_changed, sender=GameTeam.dns.through)
+def signal_team_dns_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        Host.jobs_changed()
@@ -0,0 +1,135 @@
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase, SimpleTestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from scorebot.utils.leases import LeaseWheel
+from scorebot_grid.models import Host, Service, Flag
+from scorebot_core.models import Credit, CREDIT_CACHE, OPTIONS_CACHE, token_create_new
+from scorebot_game.models import Game, GameTeam, GameTicket, GameEvent, GameCompromise, GameCompromiseHost
+
+SCOREBOARD_QUERIES = 10
+
+
+class ScoreboardQueryTest(TestCase):
+    """
+    Scorebot v3: ScoreboardQueryTest
+
+    Checks that building the scoreboard JSON runs the same number of queries no matter how many Teams, Hosts,
+    Services, Flags, Tickets and Beacons the Game has.
+    """
+
+    def setUp(self):
+        Credit(name='credit', content='Scorebot').save()
+        Credit(name='credit-team', content='Scorebot Team').save()
+
+    def create_game(self, name, teams, hosts):
+        game = Game(name=name, status=1, start=timezone.now())
+        game.save()
+        token = token_create_new(90)
+        game_teams = list()
+        for team_number in range(0, teams):
+            team = GameTeam(name='%s-%d' % (name, team_number), subnet='10.%d.%d.0/24' % (len(name), team_number),
+                            game=game)
+            team.save()
+            game_teams.append(team)
+            for host_number in range(0, hosts):
+                host = Host(fqdn='h%d.t%d.%s' % (host_number, team_number, name), team=team,
+                            ip='10.%d.%d.%d' % (len(name), team_number, host_number + 1))
+                host.save()
+                for port in (80, 443):
+                    Service(port=port, name='s%d' % port, host=host).save()
+                Flag(name='f%d' % host_number, flag='%s-%d-%d' % (name, team_number, host_number),
+                     description='flag', host=host, team=team).save()
+            GameTicket(ticket_id=team_number, name='ticket', description='ticket', team=team).save()
+        for team in game_teams[1:]:
+            beacon = GameCompromise(attacker=game_teams[0], token=token)
+            beacon.save()
+            beacon_host = team.hosts.first()
+            GameCompromiseHost(ip=beacon_host.ip, team=team, host=beacon_host, beacon=beacon).save()
+        Flag.objects.filter(team=game_teams[-1]).update(captured=game_teams[0])
+        GameEvent(game=game, timeout=timezone.now() + timedelta(minutes=5), data='event').save()
+        return game
+
+    def get_scoreboard_queries(self, game):
+        CREDIT_CACHE.clear()
+        OPTIONS_CACHE.clear()
+        game = Game.objects.get(id=game.id)
+        with CaptureQueriesContext(connection) as queries:
+            game.get_json_scoreboard()
+        return len(queries.captured_queries)
+
+    def test_scoreboard_queries(self):
+        game_small = self.create_game('small', 2, 1)
+        game_large = self.create_game('large', 6, 5)
+        queries_small = self.get_scoreboard_queries(game_small)
+        queries_large = self.get_scoreboard_queries(game_large)
+        self.assertEqual(queries_small, queries_large)
+        self.assertEqual(queries_large, SCOREBOARD_QUERIES)
+
+
+class LeaseWheelTest(SimpleTestCase):
+    """
+    Scorebot v3: LeaseWheelTest
+
+    Checks that leases added to a LeaseWheel expire on their deadline and not before, including deadlines further
+    away than one turn of the wheel and calls to "expire" that skip one or more turns.
+    """
+
+    def setUp(self):
+        self.wheel = LeaseWheel('Test', slots=8, tick=1)
+        self.assertEqual(self.wheel.expire(100), [])
+
+    def test_add_expire(self):
+        self.wheel.add(1, 103, 'a')
+        self.wheel.add(2, 105, 'b')
+        self.assertEqual(len(self.wheel), 2)
+        self.assertEqual(self.wheel.expire(102), [])
+        self.assertEqual(self.wheel.expire(103), ['a'])
+        self.assertEqual(self.wheel.expire(104), [])
+        self.assertEqual(self.wheel.expire(105.5), ['b'])
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.wheel.stats()['expired'], 2)
+
+    def test_add_past_deadline(self):
+        self.wheel.add(1, 50, 'a')
+        self.assertEqual(self.wheel.expire(101), ['a'])
+
+    def test_add_again(self):
+        self.wheel.add(1, 103, 'a')
+        self.wheel.add(1, 106, 'b')
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.wheel.expire(105), [])
+        self.assertEqual(self.wheel.expire(106), ['b'])
+
+    def test_remove(self):
+        self.wheel.add(1, 103, 'a')
+        self.wheel.add(2, 103, 'b')
+        self.assertTrue(self.wheel.remove(1))
+        self.assertFalse(self.wheel.remove(1))
+        self.assertFalse(self.wheel.remove(3))
+        self.assertEqual(self.wheel.expire(110), ['b'])
+        self.assertEqual(self.wheel.stats()['removed'], 1)
+
+    def test_deadline_past_turn(self):
+        self.wheel.add(1, 120, 'a')
+        for now in range(101, 120):
+            self.assertEqual(self.wheel.expire(now), [])
+        self.assertEqual(self.wheel.expire(120), ['a'])
+
+    def test_skipped_turn(self):
+        self.wheel.add(1, 103, 'a')
+        self.wheel.add(2, 107, 'b')
+        self.wheel.add(3, 130, 'c')
+        self.assertEqual(sorted(self.wheel.expire(111)), ['a', 'b'])
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.wheel.expire(129), [])
+        self.assertEqual(self.wheel.expire(200), ['c'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_skipped_exact_turn(self):
+        self.wheel.add(1, 101, 'a')
+        self.wheel.add(2, 108, 'b')
+        self.wheel.add(3, 109, 'c')
+        self.assertEqual(sorted(self.wheel.expire(108)), ['a', 'b'])
+        self.assertEqual(self.wheel.expire(109), ['c'])
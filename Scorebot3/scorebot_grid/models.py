@@ -3,10 +3,20 @@ import math
 import html
 
 from django.db import models
+from scorebot.utils.bulk import BulkUpdate
+from scorebot.utils.cache import CacheTable
+from scorebot.utils.flags import FLAG_INDEX
+from scorebot.utils.subnets import SUBNET_INDEX
+from scorebot_core.models import get_game_options
 from django.core.exceptions import ValidationError
 from scorebot.utils import api_info, api_debug, api_error, api_warning, api_score, api_event
 from scorebot.utils.constants import CONST_GRID_FLAG_VALUE, CONST_GRID_SERVICE_APPLICATION, \
-    CONST_GRID_SERVICE_PROTOCOL_CHOICES, CONST_GRID_SERVICE_STATUS_CHOICES, CONST_GRID_CONTENT_TYPE_DEFAULT
+    CONST_GRID_SERVICE_PROTOCOL_CHOICES, CONST_GRID_SERVICE_STATUS_CHOICES, CONST_GRID_CONTENT_TYPE_DEFAULT, \
+    CONST_GRID_SERVICE_PROTOCOL_NAMES, CONST_GRID_SERVICE_STATUS_VALUES, \
+    CONST_GAME_SCORE_HOST, CONST_GAME_SCORE_FLAG_STOLEN, CONST_GAME_SCORE_FLAG_CAPTURED, \
+    CONST_GRID_JOB_TEMPLATE_SIZE, CONST_GRID_JOB_TEMPLATE_TIMEOUT
+
+JOB_TEMPLATE_CACHE = CacheTable('JobTemplate', CONST_GRID_JOB_TEMPLATE_SIZE, CONST_GRID_JOB_TEMPLATE_TIMEOUT)
 
 
 # TODO: Expand this class with automated functions
@@ -33,6 +43,10 @@ class GridModel(models.Model):
     def get_canonical_name(self):
         return self.__class__.__name__
 
+    @staticmethod
+    def fields_changed(update_fields, *fields):
+        return update_fields is None or not set(update_fields).isdisjoint(fields)
+
 
 class DNS(GridModel):
     """
@@ -50,6 +64,14 @@ class DNS(GridModel):
     def __str__(self):
         return '[DNS] %s' % str(self.address)
 
+    def save(self, *args, **kwargs):
+        super(DNS, self).save(*args, **kwargs)
+        Host.jobs_changed()
+
+    def delete(self, *args, **kwargs):
+        Host.jobs_changed()
+        return super(DNS, self).delete(*args, **kwargs)
+
 
 class Flag(GridModel):
     """
@@ -61,6 +83,7 @@ class Flag(GridModel):
     class Meta:
         verbose_name = 'Flag'
         verbose_name_plural = 'Flags'
+        unique_together = (('team', 'flag'),)
 
     name = models.SlugField('Flag Name', max_length=150)
     flag = models.CharField('Flag Data Value', max_length=120)
@@ -75,7 +98,7 @@ class Flag(GridModel):
 
     def reset(self):
         self.captured = None
-        self.save()
+        self.save(update_fields=['captured'])
 
     def __str__(self):
         return '[Flag] %s <%s|%d>' % (self.get_canonical_name(), self.name, self.value)
@@ -90,23 +113,32 @@ class Flag(GridModel):
         if attacker is None:
             raise ValueError('Parameter "attacker" cannot be None!')
         if attacker:
+            # Claim the Flag in the database first, only one Team can win if two submit it at the same time.
+            if Flag.objects.filter(id=self.id, captured__isnull=True).update(captured=attacker) == 0:
+                api_debug('SCORING-ASYNC', 'Flag "%s" was already captured!' % self.get_canonical_name())
+                FLAG_INDEX.invalidate(attacker.game_id)
+                return False
+            FLAG_INDEX.set_captured(attacker.game_id, self.id, attacker.id)
             api_info('SCORING-ASYNC', 'Flag "%s" was captured by "%s"!'
                      % (self.get_canonical_name(), attacker.get_canonical_name()))
             self.captured = attacker
-            flag_stolen_value = int(self.team.game.get_option('flag_stolen_rate'))
+            game_options = get_game_options(self.team.game_id)
+            flag_stolen_value = game_options.flag_stolen_rate
             if flag_stolen_value > 0:
-                self.team.set_flags(-1 * flag_stolen_value)
+                self.team.set_score(CONST_GAME_SCORE_FLAG_STOLEN, -1 * flag_stolen_value, self.id)
             else:
-                multiplier = self.team.game.get_option('flag_captured_multiplier')
-                self.team.set_flags(-1 * self.value * multiplier)
+                multiplier = game_options.flag_captured_multiplier
+                self.team.set_score(CONST_GAME_SCORE_FLAG_STOLEN, -1 * self.value * multiplier, self.id)
                 api_score(self.id, 'FLAG-STOLEN', self.get_canonical_name(), -1 * self.value * multiplier,
                           self.team.get_canonical_name())
-                attacker.set_flags(self.value * multiplier)
+                attacker.set_score(CONST_GAME_SCORE_FLAG_CAPTURED, self.value * multiplier, self.id)
                 api_score(self.id, 'FLAG-STOLEN-ATTCKER', self.get_canonical_name(), self.value * multiplier,
                           attacker.get_canonical_name())
                 del multiplier
             api_event(self.team.game.id, 'A Flag from %s was stolen by %s!' % (self.team.name, attacker.name))
-            self.save()
+            self.team.flags_changed()
+            attacker.flags_changed()
+            return True
         else:
             raise ValueError('Parameter "attacker" must be a "GameTeam" object type!')
 
@@ -116,18 +148,16 @@ class Flag(GridModel):
         return self.name
 
     def save(self, *args, **kwargs):
-        if self.team is not None:
-            try:
-                flags_find = self.team.flags.all().get(flag=self.flag)
-                if flags_find.id != self.id:
-                    raise ValidationError({'flag': 'Flags on a Team cannot have the same flag value! %s-%s'
-                                                   % (self.name, flags_find.name)})
-                del flags_find
-            except Flag.DoesNotExist:
-                pass
-            except Flag.MultipleObjectsReturned:
-                raise ValidationError({'flag': 'Flags on a Team cannot have the same flag value!'})
+        # Also enforced by "unique_together", kept here for databases created before the constraint was added.
+        if self.team is not None and self.fields_changed(kwargs.get('update_fields', None), 'flag', 'team'):
+            if Flag.objects.filter(team_id=self.team_id, flag=self.flag).exclude(id=self.id).exists():
+                raise ValidationError({'flag': 'Flags on a Team cannot have the same flag value! %s' % self.name})
         super(Flag, self).save(*args, **kwargs)
+        FLAG_INDEX.invalidate(self.team.game_id if self.team is not None else None)
+
+    def delete(self, *args, **kwargs):
+        FLAG_INDEX.invalidate(self.team.game_id if self.team is not None else None)
+        return super(Flag, self).delete(*args, **kwargs)
 
 
 class Host(GridModel):
@@ -140,6 +170,7 @@ class Host(GridModel):
     class Meta:
         verbose_name = 'Host'
         verbose_name_plural = 'Hosts'
+        unique_together = (('team', 'ip'),)
 
     fqdn = models.CharField('Host Full Domain Name', max_length=150)
     online = models.BooleanField('Host Online', default=False, editable=False)
@@ -160,7 +191,7 @@ class Host(GridModel):
             service.reset()
         for flag in self.flags.all():
             flag.reset()
-        self.save()
+        self.save(update_fields=['online', 'ping_last'])
 
     def __str__(self):
         return '[Host] %s <%s> %s' % (self.get_canonical_name(), self.fqdn, ('UP' if self.online else 'DOWN'))
@@ -181,16 +212,57 @@ class Host(GridModel):
         api_debug('SCORING', 'Host "%s" is being scored!' % self.get_canonical_name())
         score = self.get_score()
         api_score(self.id, 'HOST', self.get_canonical_name(), score)
-        self.team.set_uptime(score)
+        self.team.set_score(CONST_GAME_SCORE_HOST, score, self.id)
         del score
-        self.save()
+        self.save(update_fields=['scored'])
 
     def get_json_job(self):
         if self.team is None:
             return None
         return {'host': {'fqdn': self.fqdn, 'services': [s.get_json_job() for s in self.services.all()]},
                 'dns': [str(dns.address) for dns in self.team.dns.all()],
-                'timeout': self.team.game.get_option('round_time')}
+                'timeout': get_game_options(self.team.game_id).round_time}
+
+    def get_job_template(self):
+        if self.team is None:
+            return None
+        job_json = self.get_json_job()
+        del job_json['timeout']
+        job_template = (self.team.game_id, json.dumps(job_json)[1:-1])
+        JOB_TEMPLATE_CACHE.set(self.id, job_template)
+        del job_json
+        return job_template
+
+    @staticmethod
+    def get_json_jobs(host_jobs):
+        """
+        Returns the JSON strings for the Jobs in "host_jobs", a dict of Host ID to Job ID.  The Host and DNS parts of
+        each Job are kept pre-serialized per Host, so only Hosts without a cached template are loaded from the database.
+        """
+        job_templates = dict()
+        for host_id in host_jobs.keys():
+            job_template = JOB_TEMPLATE_CACHE.get(host_id)
+            if job_template is not None:
+                job_templates[host_id] = job_template
+        if len(job_templates) < len(host_jobs):
+            for host in Host.objects.select_related('team').prefetch_related('services__content', 'team__dns')\
+                    .filter(id__in=[h for h in host_jobs.keys() if h not in job_templates]):
+                job_template = host.get_job_template()
+                if job_template is not None:
+                    job_templates[host.id] = job_template
+        job_list = list()
+        for host_id, job_template in job_templates.items():
+            job_list.append('{"id": %d, "timeout": %d, %s}' % (
+                host_jobs[host_id], get_game_options(job_template[0]).round_time, job_template[1]))
+        del job_templates
+        return job_list
+
+    @staticmethod
+    def jobs_changed(host_id=None):
+        if host_id is None:
+            JOB_TEMPLATE_CACHE.clear()
+        else:
+            JOB_TEMPLATE_CACHE.pop(host_id)
 
     def get_canonical_name(self):
         if self.team is not None:
@@ -198,38 +270,50 @@ class Host(GridModel):
         return self.name
 
     def get_json_scoreboard(self):
-        if self.team is None:
+        if self.team_id is None:
             return None
         host_json = {'name': html.escape(self.name), 'id': self.id, 'online': self.online,
                      'services': [s.get_json_scoreboard() for s in self.services.all()]}
         return host_json
 
     def save(self, *args, **kwargs):
-        if self.team is not None:
+        update_fields = kwargs.get('update_fields', None)
+        if self.fields_changed(update_fields, 'ip', 'team') and self.team is not None:
+            # Also enforced by "unique_together", kept here for databases created before the constraint was added.
             if self.ip is not None:
-                try:
-                    host_find = self.team.hosts.all().get(ip=self.ip)
-                    if host_find.id != self.id:
-                        raise ValidationError({'ip': 'Hosts on a Team cannot have the same IP address!'})
-                    del host_find
-                except Host.DoesNotExist:
-                    pass
-                except Host.MultipleObjectsReturned:
+                if Host.objects.filter(team_id=self.team_id, ip=self.ip).exclude(id=self.id).exists():
                     raise ValidationError({'ip': 'Hosts on a Team cannot have the same IP address!'})
             else:
                 api_warning('BACKEND',
                             'Host "%s" has a null value IP address and will not receive beacon scoring!' % self.fqdn)
-        if self.name is None or len(self.name) == 0:
-            if '.' in self.fqdn:
-                self.name = self.fqdn.split('.')[0]
-            else:
-                self.name = self.fqdn
+        if self.fields_changed(update_fields, 'name', 'fqdn'):
+            if self.name is None or len(self.name) == 0:
+                if '.' in self.fqdn:
+                    self.name = self.fqdn.split('.')[0]
+                else:
+                    self.name = self.fqdn
         super(Host, self).save(*args, **kwargs)
-
-    def score_job(self, job, job_data):
-        api_debug('SCORING', 'Begin Host scoring on Host "%s"' % self.get_canonical_name())
+        if self.fields_changed(update_fields, 'ip', 'team'):
+            SUBNET_INDEX.invalidate(self.team.game_id if self.team is not None else None)
+        if self.fields_changed(update_fields, 'fqdn', 'team'):
+            Host.jobs_changed(self.id)
+        del update_fields
+
+    def delete(self, *args, **kwargs):
+        SUBNET_INDEX.invalidate(self.team.game_id if self.team is not None else None)
+        Host.jobs_changed(self.id)
+        return super(Host, self).delete(*args, **kwargs)
+
+    def score_job(self, job, job_data, bulk=None):
+        if bulk is None:
+            bulk = BulkUpdate()
+            host_changed = self.score_job(job, job_data, bulk)
+            bulk.save()
+            return host_changed
+        api_debug('SCORING', 'Begin Host scoring on Host "%s"', None, self.get_canonical_name)
+        host_online = self.online
         if self.ping_min == 0:
-            ping_ratio = int(self.team.game.get_option('host_ping_ratio'))
+            ping_ratio = get_game_options(self.team.game_id).host_ping_ratio
         else:
             ping_ratio = self.ping_min
         try:
@@ -241,32 +325,39 @@ class Host(GridModel):
             except ZeroDivisionError:
                 self.online = False
                 self.ping_last = 0
-            api_debug('SCORING', 'Host "%s" was set "%s" by Job "%d".'
-                      % (self.fqdn, ('Online' if self.online else 'Offline'), job.id))
-            self.save()
-        except ValueError:
+            api_debug('SCORING', 'Host "%s" was set "%s" by Job "%d".', None, self.fqdn,
+                      ('Online' if self.online else 'Offline'), job.id)
+        except (TypeError, ValueError):
             api_error('SCORING', 'Error translating ping responses from Job "%d"!' % job.id)
             self.online = False
             self.ping_last = 0
-            self.save()
+        bulk.add(self, ['online', 'ping_last'])
+        host_changed = (host_online != self.online)
+        del host_online
         if 'services' not in job_data and self.online:
             api_error('SCORING', 'Host "%s" was set online by Job "%d" but is missing services!' % (self.fqdn, job.id))
-            return
+            return host_changed
+        job_services = dict()
+        if self.online:
+            for job_service in job_data['services']:
+                try:
+                    job_services.setdefault((int(job_service['port']), job_service['protocol'].lower()), job_service)
+                except (KeyError, TypeError, ValueError, AttributeError):
+                    pass
         for service in self.services.all():
             if not self.online:
-                service.status = 2
-                service.save()
-            else:
-                for job_service in job_data['services']:
-                    try:
-                        if service.port == int(job_service['port']) and \
-                                        service.get_protocol_display().lower() == job_service['protocol'].lower():
-                            service.score_job(job, job_service)
-                            break
-                    except ValueError:
-                        pass
-        api_debug('SCORING', 'Finished scoring Host "%s" by Job "%d".' % (self.fqdn, job.id))
+                if service.status != 2:
+                    host_changed = True
+                    service.status = 2
+                    bulk.add(service, ['status'])
+                continue
+            job_service = job_services.get((service.port, CONST_GRID_SERVICE_PROTOCOL_NAMES.get(service.protocol)))
+            if job_service is not None and service.score_job(job, job_service, bulk):
+                host_changed = True
+        del job_services
+        api_debug('SCORING', 'Finished scoring Host "%s" by Job "%d".', None, self.fqdn, job.id)
         api_score(self.id, 'HOST-JOB', self.get_canonical_name(), 0)
+        return host_changed
 
 
 class Service(GridModel):
@@ -299,7 +390,7 @@ class Service(GridModel):
     def reset(self):
         self.status = 1
         self.bonus_started = False
-        self.save()
+        self.save(update_fields=['status', 'bonus_started'])
 
     def __str__(self):
         return '[Service] %s %s<%s|%d/%s> %s'\
@@ -335,32 +426,45 @@ class Service(GridModel):
                 'protocol': html.escape(self.get_protocol_display()[0].lower()), 'port': self.port, 'bonus': self.bonus}
 
     def save(self, *args, **kwargs):
-        if self.content is not None:
-            self.content.save()
+        update_fields = kwargs.get('update_fields', None)
+        host_last = None
+        if self.pk is not None and self.fields_changed(update_fields, 'host'):
+            host_last = Service.objects.filter(id=self.pk).values_list('host_id', flat=True).first()
         super(Service, self).save(*args, **kwargs)
-
-    def score_job(self, job, job_data):
+        if self.fields_changed(update_fields, 'port', 'application', 'protocol', 'content', 'host'):
+            Host.jobs_changed(self.host_id)
+        if host_last is not None and host_last != self.host_id:
+            Host.jobs_changed(host_last)
+        del host_last
+        del update_fields
+
+    def delete(self, *args, **kwargs):
+        Host.jobs_changed(self.host_id)
+        return super(Service, self).delete(*args, **kwargs)
+
+    def score_job(self, job, job_data, bulk=None):
+        if bulk is None:
+            bulk = BulkUpdate()
+            service_changed = self.score_job(job, job_data, bulk)
+            bulk.save()
+            return service_changed
         if 'status' not in job_data:
             api_error('SCORING', 'Invalid Service "%s" JSON data by Job "%d"!' % (self.get_canonical_name(), job.id))
-            return
-        service_status = self.status
-        job_status = job_data['status'].lower()
-        for status_value in CONST_GRID_SERVICE_STATUS_CHOICES:
-            if status_value[1].lower() == job_status:
-                service_status = status_value[0]
-                break
+            return False
+        service_status = CONST_GRID_SERVICE_STATUS_VALUES.get(str(job_data['status']).lower(), self.status)
         if service_status == 0 and self.bonus and not self.bonus_started:
             self.bonus_started = True
+        service_changed = (self.status != service_status)
         self.status = service_status
-        self.save()
-        api_debug('SCORING', 'Service "%s" was set "%s" by Job "%d".'
-                  % (self.get_canonical_name(), self.get_status_display(), job.id))
+        bulk.add(self, ['status', 'bonus_started'])
+        api_debug('SCORING', 'Service "%s" was set "%s" by Job "%d".', None, self.get_canonical_name,
+                  self.get_status_display, job.id)
         if 'content' in job_data and self.content is not None:
             if 'status' in job_data['content']:
                 try:
                     self.content.status = int(job_data['content']['status'])
-                    api_debug('SCORING', 'Service Content for "%s" was set to "%d" by Job "%d".' %
-                              (self.get_canonical_name(), self.content.status, job.id))
+                    api_debug('SCORING', 'Service Content for "%s" was set to "%d" by Job "%d".', None,
+                              self.get_canonical_name, self.content.status, job.id)
                 except ValueError:
                     self.content.status = 0
                     api_error('SCORING', 'Service Content for "%s" was invalid in Job "%d".' %
@@ -369,14 +473,15 @@ class Service(GridModel):
                 self.content.status = 0
                 api_error('SCORING', 'Service Content for "%s" was invalid in Job "%d".' %
                           (self.get_canonical_name(), job.id))
-            self.content.save()
+            bulk.add(self.content, ['status'])
         elif self.content is not None:
             self.content.status = 0
-            self.content.save()
+            bulk.add(self.content, ['status'])
             api_error('SCORING', 'Service Content for "%s" was ignored by Job "%d".' %
                       (self.get_canonical_name(), job.id))
-        api_debug('SCORING', 'Finished scoring Service "%s" by Job "%d".' % (self.get_canonical_name(), job.id))
+        api_debug('SCORING', 'Finished scoring Service "%s" by Job "%d".', None, self.get_canonical_name, job.id)
         api_score(self.id, 'SERVICE-JOB', self.get_canonical_name(), 0)
+        return service_changed
 
 
 class Content(GridModel):
@@ -398,7 +503,7 @@ class Content(GridModel):
 
     def reset(self):
         self.status = 0
-        self.save()
+        self.save(update_fields=['status'])
 
     def __str__(self):
         return '[Content] %s <%s>' % ((self.service.all().last().get_canonical_name()
@@ -412,10 +517,16 @@ class Content(GridModel):
         return {'type': self.type, 'content': content}
 
     def save(self, *args, **kwargs):
-        # TODO: Check if this is needed now
-        #if self.service.all().count() > 1:
-        #    raise ValidationError({'service': 'Content objects cannot be linked to multiple Service objects!'})
         super(Content, self).save(*args, **kwargs)
+        if not self.fields_changed(kwargs.get('update_fields', None), 'data', 'type'):
+            return
+        for host_id in Service.objects.filter(content_id=self.id).values_list('host_id', flat=True):
+            Host.jobs_changed(host_id)
+
+    def delete(self, *args, **kwargs):
+        for host_id in Service.objects.filter(content_id=self.id).values_list('host_id', flat=True):
+            Host.jobs_changed(host_id)
+        return super(Content, self).delete(*args, **kwargs)
 
 
 # TODO: Add Hypervisor hooks to this class